@@ -0,0 +1,66 @@
+"""
+Benchmark of `align_spans` and `filter_overlapping_spans` on synthetic documents.
+It compares them with the nested loop over every token and every span they replace,
+and checks that both produce the same alignments. Run it from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/alignment.py --tokens 10000 --spans 1000
+"""
+import argparse
+import random
+import timeit
+
+from zshot.utils.alignment_utils import AlignmentMode, align_spans, filter_overlapping_spans
+from zshot.utils.data_models import Span
+
+
+def nested_loop_align_spans(spans, tokens_offsets, alignment_mode):
+    alignments = [[] for _ in range(len(tokens_offsets))]
+    for idt, (t_start, t_end) in enumerate(tokens_offsets):
+        for ids, s in enumerate(spans):
+            if alignment_mode == AlignmentMode.expand:
+                if t_start <= s.start < t_end or t_start < s.end <= t_end or (s.start <= t_start and s.end >= t_end):
+                    alignments[idt].append(ids)
+            elif t_start >= s.start and t_end <= s.end:
+                alignments[idt].append(ids)
+    return alignments
+
+
+def synthetic_document(num_tokens, num_spans, labels):
+    tokens = ["".join(random.choices("abcdefghij", k=random.randint(1, 10))) for _ in range(num_tokens)]
+    text_length = sum(len(t) + 1 for t in tokens)
+    spans = []
+    for _ in range(num_spans):
+        start = random.randint(0, text_length)
+        spans.append(Span(start=start, end=start + random.randint(1, 30), label=random.choice(labels),
+                          score=random.random()))
+    return tokens, spans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=10000, help="Number of tokens of the document")
+    parser.add_argument("--spans", type=int, default=1000, help="Number of spans")
+    parser.add_argument("--labels", type=int, default=5, help="Number of labels")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each implementation")
+    args = parser.parse_args()
+
+    random.seed(0)
+    tokens, spans = synthetic_document(args.tokens, args.spans, [f"label_{i}" for i in range(args.labels)])
+    tokens_offsets = align_spans([], tokens, join_by=" ", return_dict=True)['tokens_offsets']
+    for mode in AlignmentMode:
+        assert align_spans(spans, tokens, tokens_offsets, alignment_mode=mode) == \
+            nested_loop_align_spans(spans, tokens_offsets, mode)
+
+    benchmarks = [
+        ("align_spans (nested loop)", lambda: nested_loop_align_spans(spans, tokens_offsets, AlignmentMode.expand)),
+        ("align_spans (sweep)", lambda: align_spans(spans, tokens, tokens_offsets)),
+        ("filter_overlapping_spans", lambda: filter_overlapping_spans(spans, tokens, tokens_offsets)),
+    ]
+    print(f"{args.tokens} tokens, {args.spans} spans")
+    for name, func in benchmarks:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:<30}{best * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
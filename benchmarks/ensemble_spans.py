@@ -0,0 +1,90 @@
+"""
+Micro-benchmark of the span operations of the ensemble linker over synthetic span sets.
+It compares `Ensembler.inclusive` and `sub_span_scoring_per_description` with the pairwise implementations
+they replace, and checks that both produce the same output. Run it from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/ensemble_spans.py --spans 2000 --voters 8
+"""
+import argparse
+import random
+import timeit
+
+from zshot.linker.linker_ensemble.utils import sub_span_scoring_per_description
+from zshot.utils.data_models import Span
+from zshot.utils.ensembler import Ensembler
+
+
+def pairwise_inclusive(spans):
+    non_overlapping_spans = []
+    for span in spans:
+        if not any(span.start >= other.start and span.end <= other.end
+                   and (span.start > other.start or span.end < other.end) for other in spans):
+            non_overlapping_spans.append(span)
+    return non_overlapping_spans
+
+
+def pairwise_sub_span_scoring_per_description(union_spans, spans):
+    for k in union_spans.keys():
+        for span in spans:
+            labels = {}
+            for p in span:
+                if k[0] <= p.start and k[1] >= p.end and (k[0] < p.start or k[1] > p.end):
+                    if p.label not in labels or labels[p.label].score < p.score:
+                        labels[p.label] = p
+            for p in labels.values():
+                union_spans[k].append(Span(label=p.label, score=p.score, start=k[0], end=k[1]))
+
+
+def synthetic_spans(num_spans, num_voters, labels, doc_length):
+    spans = []
+    for _ in range(num_voters):
+        voter_spans = []
+        for _ in range(num_spans):
+            start = random.randint(0, doc_length)
+            voter_spans.append(Span(start=start, end=start + random.randint(1, 20), label=random.choice(labels),
+                                    score=random.random()))
+        spans.append(voter_spans)
+    return spans
+
+
+def union(spans):
+    union_spans = {}
+    for voter_spans in spans:
+        for s in voter_spans:
+            union_spans.setdefault((s.start, s.end), []).append(s)
+    return union_spans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--spans", type=int, default=1000, help="Number of spans of each voter")
+    parser.add_argument("--voters", type=int, default=4, help="Number of voters")
+    parser.add_argument("--labels", type=int, default=5, help="Number of labels")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each implementation")
+    args = parser.parse_args()
+
+    random.seed(0)
+    labels = [f"label_{i}" for i in range(args.labels)]
+    spans = synthetic_spans(args.spans, args.voters, labels, doc_length=args.spans * 10)
+    all_spans = [s for voter_spans in spans for s in voter_spans]
+
+    assert Ensembler.inclusive(all_spans) == pairwise_inclusive(all_spans)
+    expected, union_spans = union(spans), union(spans)
+    pairwise_sub_span_scoring_per_description(expected, spans)
+    sub_span_scoring_per_description(union_spans, spans)
+    assert union_spans == expected
+
+    benchmarks = [
+        ("inclusive (pairwise)", lambda: pairwise_inclusive(all_spans)),
+        ("inclusive (sweep)", lambda: Ensembler.inclusive(all_spans)),
+        ("sub_span_scoring (pairwise)", lambda: pairwise_sub_span_scoring_per_description(union(spans), spans)),
+        ("sub_span_scoring (sorted)", lambda: sub_span_scoring_per_description(union(spans), spans)),
+    ]
+    print(f"{args.voters} voters x {args.spans} spans, {args.labels} labels")
+    for name, func in benchmarks:
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f"{name:<30}{best * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 
 from zshot.knowledge_extractor.knowgl.utils import get_words_mappings, get_spans, get_triples
 from zshot.knowledge_extractor.knowledge_extractor import KnowledgeExtractor
+from zshot.utils.batching import restore_order, token_budget_batches
 from zshot.utils.data_models import Span
 from zshot.utils.data_models.relation_span import RelationSpan
 
@@ -61,17 +62,25 @@ class KnowGL(KnowledgeExtractor):
         if not self.model:
             self.load_models()
 
+        docs = list(docs)
         texts = [d.text for d in docs]
-        input_data = self.tokenizer(texts,
-                                    truncation=True,
-                                    padding=True,
-                                    return_tensors="pt")
-        input_ids = input_data.input_ids.to(self.model.device)
-        outputs = self.model.generate(inputs=input_ids)
+        if self.batch_max_tokens:
+            lengths = [len(input_ids) for input_ids in self.tokenizer(texts, truncation=True).input_ids]
+            batches = token_budget_batches(lengths, self.batch_max_tokens, batch_size)
+        else:
+            batches = [list(range(len(texts)))]
 
         triples = []
-        for doc, output, encodings in zip(docs, outputs, input_data.encodings):
-            result = self.tokenizer.decode(token_ids=output, skip_special_tokens=True)
-            triples.append(self.parse_result(result, doc, encodings))
+        for batch in batches:
+            input_data = self.tokenizer([texts[i] for i in batch],
+                                        truncation=True,
+                                        padding=True,
+                                        return_tensors="pt")
+            input_ids = input_data.input_ids.to(self.model.device)
+            outputs = self.model.generate(inputs=input_ids)
 
-        return triples
+            for i, output, encodings in zip(batch, outputs, input_data.encodings):
+                result = self.tokenizer.decode(token_ids=output, skip_special_tokens=True)
+                triples.append(self.parse_result(result, docs[i], encodings))
+
+        return restore_order(batches, triples)
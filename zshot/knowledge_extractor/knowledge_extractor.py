@@ -20,6 +20,7 @@ class KnowledgeExtractor(ABC):
         :param device: Device to be used for computation
         """
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu") if device is None else device
+        self.batch_max_tokens = None
 
     def set_device(self, device: Union[str, torch.device]):
         """
@@ -29,6 +30,14 @@ class KnowledgeExtractor(ABC):
         """
         self.device = device
 
+    def set_batch_max_tokens(self, batch_max_tokens: Optional[int]):
+        """
+        Set the max number of tokens (including padding) in a batch. When set, inputs are sorted by length
+        and packed into batches up to this budget instead of batches of `batch_size` documents
+        :param batch_max_tokens: Max number of tokens in a batch, or None to batch by number of documents
+        """
+        self.batch_max_tokens = batch_max_tokens
+
     def load_models(self):
         """
         Load the model
@@ -74,8 +83,9 @@ class KnowledgeExtractor(ABC):
             entities, relations = self.parse_triples(preds)
             d._.relations = relations
             d._.spans = entities
-            d.ents = map(lambda p: p.to_spacy_span(d), filter_overlapping_spans(entities, list(d),
-                                                                                tokens_offsets=spacy_token_offsets(d)))
+            tokens_offsets = spacy_token_offsets(d, as_list=True)
+            d.ents = map(lambda p: p.to_spacy_span(d),
+                         filter_overlapping_spans(entities, d, tokens_offsets=tokens_offsets))
 
     @staticmethod
     def version() -> str:
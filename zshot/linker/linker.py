@@ -2,14 +2,16 @@ import os
 import pickle as pkl
 import zlib
 from abc import ABC, abstractmethod
-from typing import Iterator, List, Optional, Union
+from typing import Any, Iterator, List, Optional, Union
 
+import numpy as np
 import torch
 from spacy.tokens import Doc
 from spacy.util import ensure_path
 
-from zshot.utils.data_models import Entity, Span
-from zshot.utils.alignment_utils import filter_overlapping_spans, spacy_token_offsets
+from zshot.utils.data_models import Entity, Span, SpanBatch
+from zshot.utils.alignment_utils import filter_overlapping_span_batch, filter_overlapping_spans, spacy_token_offsets
+from zshot.utils.versioning import KGVersion, kg_version
 
 
 class Linker(ABC):
@@ -20,8 +22,10 @@ class Linker(ABC):
 
     def __init__(self, device: Optional[Union[str, torch.device]] = None):
         self._entities = None
+        self._entities_version = None
         self._is_end2end = False
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu") if device is None else device
+        self.batch_max_tokens = None
 
     def set_device(self, device: Union[str, torch.device]):
         """
@@ -31,18 +35,32 @@ class Linker(ABC):
         """
         self.device = device
 
+    def set_batch_max_tokens(self, batch_max_tokens: Optional[int]):
+        """
+        Set the max number of tokens (including padding) in a batch. When set, inputs are sorted by length
+        and packed into batches up to this budget instead of batches of `batch_size` documents
+        :param batch_max_tokens: Max number of tokens in a batch, or None to batch by number of documents
+        """
+        self.batch_max_tokens = batch_max_tokens
+
     def set_kg(self, entities: Iterator[Entity]):
         """
         Set entities that linker can use
         :param entities: The list of entities
         """
         self._entities = entities
+        self._entities_version = kg_version(entities)
 
     @property
     def entities(self) -> List[Entity]:
         """ Entities to link to """
         return self._entities
 
+    @property
+    def entities_version(self) -> Optional[KGVersion]:
+        """ Version stamp of the entities. It only changes when the content of the entities changes """
+        return self._entities_version
+
     def load_models(self):
         """
         Load the model
@@ -50,13 +68,22 @@ class Linker(ABC):
         """
         pass
 
+    def shared_attributes(self) -> List[Any]:
+        """
+        Read-only attributes that the copies of the linker (e.g. the voters of an ensemble) share instead of
+        copying them. By default, the models (torch modules) and the memory mapped arrays
+        :return: Attributes to share
+        """
+        return [value for value in vars(self).values() if isinstance(value, (torch.nn.Module, np.memmap))]
+
     @abstractmethod
-    def predict(self, docs: Iterator[Doc], batch_size: Optional[Union[int, None]] = None) -> List[List[Span]]:
+    def predict(self, docs: Iterator[Doc],
+                batch_size: Optional[Union[int, None]] = None) -> Union[List[List[Span]], SpanBatch]:
         """
         Perform the entity prediction
         :param docs: A list of spacy Document
         :param batch_size: The batch size
-        :return: List Spans for each Document in docs
+        :return: List Spans for each Document in docs, or a SpanBatch with the Spans of all the Documents
         """
         pass
 
@@ -74,17 +101,25 @@ class Linker(ABC):
 
     def link(self, docs: Iterator[Doc], batch_size: Optional[Union[int, None]] = None):
         """
-        Perform the entity linking. Call the predict function and add entities to the Spacy Docs
+        Perform the entity linking. Call the predict function and add entities to the Spacy Docs.
+        A SpanBatch prediction is filtered as a batch, and only converted to Spans to set the `spans` extension
         :param docs: A list of spacy Document
         :param batch_size: The batch size
         :return:
         """
         predictions_spans = self.predict(docs, batch_size)
+        if isinstance(predictions_spans, SpanBatch):
+            ents = filter_overlapping_span_batch(predictions_spans, docs).to_spacy_spans(docs)
+            for d, preds, d_ents in zip(docs, predictions_spans.to_spans(), ents):
+                d._.spans = preds
+                d.ents = d_ents
+            return
 
         for d, preds in zip(docs, predictions_spans):
             d._.spans = preds
-            d.ents = map(lambda p: p.to_spacy_span(d), filter_overlapping_spans(preds, list(d),
-                                                                                tokens_offsets=spacy_token_offsets(d)))
+            tokens_offsets = spacy_token_offsets(d, as_list=True)
+            d.ents = map(lambda p: p.to_spacy_span(d),
+                         filter_overlapping_spans(preds, d, tokens_offsets=tokens_offsets))
             # d.spans = map(lambda p: p.to_spacy_span(d), preds)
 
     @staticmethod
@@ -1,3 +1,5 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Iterator, Optional, List
 
 from spacy.tokens import Doc
@@ -5,15 +7,34 @@ from spacy.tokens import Doc
 from zshot.linker import Linker
 from zshot.linker import LinkerSMXM
 from zshot.utils.ensembler import Ensembler
-from zshot.utils.data_models import Entity
+from zshot.utils.data_models import Entity, Span
+from zshot.utils.data_models.span_batch import as_spans
 from zshot.linker.linker_ensemble.utils import sub_span_scoring_per_description, get_enhance_entities
 
 
+def predict_voters(voters: List[Linker], docs: List[Doc], batch_size=None) -> List[List[List[Span]]]:
+    """
+    Perform the entity prediction with a group of voters. A group of several voters must be SMXM voters
+    of the same model, which share the encoding of the (sentence, description) pairs
+    :param voters: Voters of the group
+    :param docs: A list of spacy Document
+    :param batch_size: The batch size
+    :return: List Spans for each Document in docs, for each voter
+    """
+    if len(voters) > 1:
+        variants_spans = voters[0].predict_variants(docs, [voter.entities for voter in voters], batch_size,
+                                                    tuple(voter.entities_version for voter in voters))
+        return [as_spans(spans) for spans in variants_spans]
+    return [as_spans(voters[0].predict(docs, batch_size))]
+
+
 class LinkerEnsemble(Linker):
     def __init__(self,
                  linkers: Optional[List[Linker]] = None,
                  strategy: Optional[str] = 'max',
-                 threshold: Optional[float] = 0.5):
+                 threshold: Optional[float] = 0.5,
+                 executor: Optional[str] = None,
+                 max_workers: Optional[int] = None):
         """ Ensemble of linkers and entities to improve performance.
             Each combination of linker with entity will be a voter.
 
@@ -22,7 +43,13 @@ class LinkerEnsemble(Linker):
             When `max` choose the label with max total vote score
             When `count` choose the label with max total vote count
         :param threshold: Threshold to use. Proportion of voters voting the entity
+        :param executor: Pool used to run the voters concurrently. Options: thread.
+            If None, the voters run one after the other. The voters share their models, and torch releases
+            the GIL during the forward passes, so threads are used instead of processes
+        :param max_workers: Max number of workers of the pool. If None, the default of the pool is used
         """
+        if executor not in (None, 'thread'):
+            raise ValueError(f"Executor {executor} not supported. Options: thread")
         super(LinkerEnsemble, self).__init__()
         if linkers is not None:
             self.linkers = linkers
@@ -34,7 +61,19 @@ class LinkerEnsemble(Linker):
         self.enhance_entities = []
         self.strategy = strategy
         self.threshold = threshold
+        self.executor = executor
+        self.max_workers = max_workers
         self.ensembler = None
+        self.voters = None
+
+    def set_batch_max_tokens(self, batch_max_tokens: Optional[int]):
+        """
+        Set the max number of tokens in a batch of the linkers of the ensemble and of their voters
+        :param batch_max_tokens: Max number of tokens in a batch, or None to batch by number of documents
+        """
+        super().set_batch_max_tokens(batch_max_tokens)
+        for linker in self.linkers + (self.voters or []):
+            linker.set_batch_max_tokens(batch_max_tokens)
 
     def set_smxm_model(self, smxm_model):
         for linker in self.linkers:
@@ -43,16 +82,36 @@ class LinkerEnsemble(Linker):
 
     def set_kg(self, entities: Iterator[Entity]):
         """
-        Set entities that linker can use
+        Set entities that linker can use. The ensembler is only rebuilt if the entities changed
         :param entities: The list of entities
         """
+        old_version = self.entities_version
         super().set_kg(entities)
+        if self.entities_version == old_version:
+            return
         self.enhance_entities = get_enhance_entities(self.entities)
         self.ensembler = Ensembler(len(self.linkers),
                                    len(self.enhance_entities) if self.enhance_entities is not None else -1,
                                    threshold=self.threshold)
         for linker in self.linkers:
             linker.set_kg(entities)
+        self.voters = None
+
+    def build_voters(self):
+        """
+        Create the voters: a copy of each linker for each set of enhanced entities, so every voter keeps its
+        own entities and derived state (tries, tokenized descriptions...). The read-only state of a linker
+        (models, given tries...) is loaded once and shared by all its copies, see `Linker.shared_attributes`
+        """
+        voters = []
+        for entities in self.enhance_entities:
+            for linker in self.linkers:
+                linker.load_models()
+                shared_attributes = {id(value): value for value in linker.shared_attributes()}
+                voter = copy.deepcopy(linker, memo=shared_attributes)
+                voter.set_kg(entities)
+                voters.append(voter)
+        self.voters = voters
 
     def predict(self, docs: Iterator[Doc], batch_size=None):
         """
@@ -61,12 +120,30 @@ class LinkerEnsemble(Linker):
         :param batch_size: The batch size
         :return: List Spans for each Document in docs
         """
-        spans = []
-        for entities in self.enhance_entities:
-            self.set_kg(entities)
-            for linker in self.linkers:
-                span_prediction = linker.predict(docs, batch_size)
-                spans.append(span_prediction)
+        if self.voters is None:
+            self.build_voters()
+        docs = list(docs)
+        # SMXM voters of the same model run together, so the (sentence, description) pairs shared by
+        # their entities are only encoded once
+        groups = {}
+        for idx, voter in enumerate(self.voters):
+            key = (voter.model_name, voter.chunk_size) if isinstance(voter, LinkerSMXM) else idx
+            groups.setdefault(key, []).append(idx)
+        groups = list(groups.values())
+
+        spans = [None] * len(self.voters)
+        if self.executor is None:
+            for group in groups:
+                group_spans = predict_voters([self.voters[i] for i in group], docs, batch_size)
+                for idx, span_prediction in zip(group, group_spans):
+                    spans[idx] = span_prediction
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = {pool.submit(predict_voters, [self.voters[i] for i in group], docs, batch_size): group
+                           for group in groups}
+                for future in as_completed(futures):
+                    for idx, span_prediction in zip(futures[future], future.result()):
+                        spans[idx] = span_prediction
 
         return self.prediction_ensemble(spans)
 
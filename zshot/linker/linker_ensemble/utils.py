@@ -1,20 +1,38 @@
 import random
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Tuple
 
 from zshot.utils.data_models import Span
 
 
-def sub_span_scoring_per_description(union_spans, spans):
+def sub_span_scoring_per_description(union_spans: Dict[Tuple[int, int], List[Span]], spans: List[List[Span]]):
+    """
+    Add to each union span the votes of its sub-spans: for each voter and label, the best sub-span strictly
+    included in the union span votes for it. The spans of each voter are sorted by start, so only the spans
+    starting inside the union span are checked
+    :param union_spans: Spans of all the voters, grouped by position
+    :param spans: Spans predicted by each voter
+    """
+    voters_index = []
+    for span in spans:
+        order = sorted(range(len(span)), key=lambda i: span[i].start)
+        voters_index.append((order, [span[i].start for i in order]))
+
     for k in union_spans.keys():
-        for span in spans:
+        for span, (order, starts) in zip(spans, voters_index):
             labels = {}
-            for p in span:
-                if k[0] <= p.start and k[1] >= p.end:
-                    if k[0] < p.start or k[1] > p.end:
-                        if p.label not in labels:
-                            labels[p.label] = p
-                        elif labels[p.label].score < p.score:
-                            labels[p.label] = p
-            for p in labels.values():
+            for i in order[bisect_left(starts, k[0]):bisect_right(starts, k[1])]:
+                p = span[i]
+                if p.end <= k[1] and (k[0] < p.start or k[1] > p.end):
+                    # Keep the first sub-span with the max score, and the label order of the voter spans
+                    first_idx, best_idx = labels.get(p.label, (i, i))
+                    if i < first_idx:
+                        first_idx = i
+                    if span[best_idx].score < p.score or (span[best_idx].score == p.score and i < best_idx):
+                        best_idx = i
+                    labels[p.label] = (first_idx, best_idx)
+            for _, best_idx in sorted(labels.values()):
+                p = span[best_idx]
                 union_spans[k].append(Span(label=p.label, score=p.score, start=k[0], end=k[1]))
 
 
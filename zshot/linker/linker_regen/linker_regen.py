@@ -1,3 +1,5 @@
+from collections import Counter
+from functools import partial
 from typing import Iterator, Optional, Union, List
 
 import torch
@@ -6,8 +8,9 @@ from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 
 from zshot.config import MODELS_CACHE_PATH
 from zshot.linker.linker import Linker
-from zshot.linker.linker_regen.trie import Trie
+from zshot.linker.linker_regen.trie import Trie, TrieCursor
 from zshot.linker.linker_regen.utils import create_input
+from zshot.utils.batching import make_batches, restore_order
 from zshot.utils.data_models import Entity, Span
 
 MODEL_NAME = "ibm/regen-disambiguation"
@@ -23,8 +26,8 @@ class LinkerRegen(Linker):
         :param max_input_len: Max length of input
         :param max_output_len: Max length of output
         :param num_beams: Number of beans to use
-        :param trie: If the trie is given the linker will use it to restrict the search space.
-        Custom entities won't be used if the trie is given.
+        :param trie: If the trie (`Trie` or `ArrayTrie`) is given the linker will use it to restrict
+        the search space. Custom entities won't be used if the trie is given.
         """
         super().__init__()
         self.model = None
@@ -34,21 +37,35 @@ class LinkerRegen(Linker):
         self.num_beams = num_beams
         self.skip_set_kg = False if trie is None else True
         self.trie = trie
+        # Names of the entities in the trie and their token ids
+        self._names = Counter()
+        self._names_ids = {}
 
     def set_kg(self, entities: Iterator[Entity]):
-        """ Set new entities
+        """ Set new entities. The trie is only updated if the entities changed, adding the names of
+        the new entities and removing the names of the entities that are not used anymore
 
         :param entities: New entities to use
         """
+        old_version = self.entities_version
         super().set_kg(entities)
-        if not self.skip_set_kg:
+        if not self.skip_set_kg and self.entities_version != old_version:
             self.load_tokenizer()
-            self.trie = Trie(
-                [
-                    self.tokenizer(e.name, return_tensors="pt")['input_ids'][0].tolist()
-                    for e in entities
-                ]
-            )
+            if self.trie is None:
+                self.trie = Trie()
+            names = Counter(e.name for e in self.entities or [])
+            for name, count in (self._names - names).items():
+                for _ in range(count):
+                    self.trie.remove(self._names_ids[name])
+                if name not in names:
+                    del self._names_ids[name]
+            new_names = [name for name in names if name not in self._names_ids]
+            if new_names:
+                self._names_ids.update(zip(new_names, self.tokenizer(new_names)['input_ids']))
+            for name, count in (names - self._names).items():
+                for _ in range(count):
+                    self.trie.add(self._names_ids[name])
+            self._names = names
 
     def load_models(self):
         """ Load Model """
@@ -56,15 +73,28 @@ class LinkerRegen(Linker):
             self.model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME, cache_dir=MODELS_CACHE_PATH)
         self.load_tokenizer()
 
+    def shared_attributes(self):
+        """ The trie given to the linker doesn't depend on the entities, so the copies of the linker share it """
+        shared = super().shared_attributes()
+        if self.skip_set_kg and self.trie is not None:
+            shared.append(self.trie)
+        return shared
+
     def load_tokenizer(self):
         """ Load Tokenizer"""
         if self.tokenizer is None:
             self.tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, model_max_length=1024,
                                                            cache_dir=MODELS_CACHE_PATH)
 
-    def restrict_decode_vocab(self, _, prefix_beam):
-        """ Restrict the possibilities of the Beam search to force the text generation """
-        tokens = self.trie.postfix(prefix_beam.tolist())
+    def restrict_decode_vocab(self, _, prefix_beam, cursor: Optional[TrieCursor] = None):
+        """ Restrict the possibilities of the Beam search to force the text generation
+
+        :param prefix_beam: Tokens generated in the beam
+        :param cursor: Cursor of the trie. If given, the node of each prefix is cached in the cursor,
+        so every decoding step only moves one node down the trie. The whole prefix is still converted
+        and hashed at every step, see `TrieCursor`
+        """
+        tokens = (cursor or self.trie).postfix(prefix_beam.tolist())
         if not tokens:
             return [self.tokenizer.eos_token_id]
 
@@ -74,7 +104,7 @@ class LinkerRegen(Linker):
         """
         Perform the entity prediction
         :param docs: A list of spacy Document
-        :param batch_size: The batch size
+        :param batch_size: Number of mentions (from any of the documents) linked in the same generate call
         :return: List Spans for each Document in docs
         """
         self.load_models()
@@ -101,32 +131,37 @@ class LinkerRegen(Linker):
         if not sentences:
             return []
 
+        input_ids = self.tokenizer(sentences)['input_ids']
+        batches = make_batches([len(ids) for ids in input_ids], batch_size, self.batch_max_tokens)
+        num_return_sequences = min(self.num_beams, len(self.entities)) if self.entities else self.num_beams
+
         sequences = []
         scores = []
-        for sent in sentences:
-            input_args = {
-                k: v
-                for k, v in self.tokenizer.batch_encode_plus(
-                    [sent], padding=True, return_tensors="pt"
-                ).items()
-            }
+        for batch in batches:
+            input_args = self.tokenizer.pad({'input_ids': [input_ids[i] for i in batch]}, return_tensors="pt")
 
             outputs = self.model.generate(
                 **input_args,
                 min_length=0,
                 max_length=self.max_output_len,
                 num_beams=self.num_beams,
-                num_return_sequences=min(self.num_beams, len(self.entities)) if self.entities else self.num_beams,
+                num_return_sequences=num_return_sequences,
                 output_scores=True,
                 return_dict_in_generate=True,
                 prefix_allowed_tokens_fn=None
                 if self.trie is None
-                else self.restrict_decode_vocab,
+                else partial(self.restrict_decode_vocab, cursor=self.trie.cursor()),
             )
 
-            tmp_scores = torch.nn.Softmax()(outputs.sequences_scores)
-            sequences.append(outputs.sequences[torch.argmax(tmp_scores)])
-            scores.append(max(tmp_scores.cpu().numpy().tolist()))
+            # The returned sequences of each mention are consecutive rows
+            batch_sequences = outputs.sequences.view(len(batch), num_return_sequences, -1)
+            tmp_scores = torch.softmax(outputs.sequences_scores.view(len(batch), num_return_sequences), dim=-1)
+            batch_scores, best = torch.max(tmp_scores, dim=-1)
+            sequences.extend(batch_sequences[torch.arange(len(batch)), best])
+            scores.extend(batch_scores.cpu().numpy().tolist())
+
+        sequences = restore_order(batches, sequences)
+        scores = restore_order(batches, scores)
 
         docs_pred = {}
         for data, out, score in zip(data_to_link, sequences, scores):
@@ -1,19 +1,59 @@
-from typing import Collection
+import os
+from collections import deque
+from typing import Any, Collection, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+OFFSETS_FILE_NAME = "offsets.npy"
+TOKENS_FILE_NAME = "tokens.npy"
 
 
 class Trie(object):
     def __init__(self, sequences: Collection[Collection[int]] = []):
         self.trie_dict = {}
+        self.sequence_counts = {}
         for sequence in sequences:
             self.add(sequence)
 
+    def __setstate__(self, state):
+        # Tries pickled before sequence counts were added
+        state.setdefault("sequence_counts", {})
+        self.__dict__.update(state)
+
     def add(self, sequence: Collection[int]):
+        sequence = tuple(sequence)
+        self.sequence_counts[sequence] = self.sequence_counts.get(sequence, 0) + 1
         trie = self.trie_dict
         for idx in sequence:
             if idx not in trie:
                 trie[idx] = {}
             trie = trie[idx]
 
+    def remove(self, sequence: Collection[int]):
+        """
+        Remove a sequence added to the trie. Sequences are reference counted, so a sequence added several times
+        stays in the trie until it is removed the same number of times. Nodes of the sequence are only removed
+        if no other sequence goes through them, so shared prefixes are kept
+        :param sequence: Sequence to remove
+        """
+        sequence = tuple(sequence)
+        count = self.sequence_counts.get(sequence, 0)
+        if count == 0:
+            raise ValueError(f"Sequence {sequence} not in the trie")
+        if count > 1:
+            self.sequence_counts[sequence] = count - 1
+            return
+        del self.sequence_counts[sequence]
+
+        path = [self.trie_dict]
+        for idx in sequence:
+            path.append(path[-1][idx])
+        # Remove the nodes from the end of the sequence while they don't have children and no sequence ends in them
+        for depth in range(len(sequence), 0, -1):
+            if path[depth] or sequence[:depth] in self.sequence_counts:
+                break
+            del path[depth - 1][sequence[depth - 1]]
+
     def postfix(self, prefix_sequence: Collection[int]):
         if len(prefix_sequence) == 1:
             return list(self.trie_dict.keys())
@@ -23,3 +63,186 @@ class Trie(object):
                 return []
             trie = trie[pfx]
         return list(trie.keys())
+
+    @property
+    def root(self) -> dict:
+        """ Root node of the trie """
+        return self.trie_dict
+
+    def child(self, node: dict, idx: int) -> Optional[dict]:
+        """
+        Get the child of a node
+        :param node: Node of the trie
+        :param idx: Token of the child
+        :return: The child node or None if the node has no child with that token
+        """
+        return node.get(idx)
+
+    def children(self, node: dict) -> List[int]:
+        """
+        Get the tokens of the children of a node
+        :param node: Node of the trie
+        :return: List of tokens that can follow the node
+        """
+        return list(node.keys())
+
+    def cursor(self) -> "TrieCursor":
+        """
+        Create a cursor to get the postfixes of growing prefixes incrementally
+        :return: A new cursor with an empty cache
+        """
+        return TrieCursor(self)
+
+
+class ArrayTrie(object):
+    """ Compact, read-only trie stored in two arrays (CSR format).
+    Nodes are numbered in breadth-first order, with the root as node 0. The children tokens of node `i` are
+    `tokens[offsets[i]:offsets[i + 1]]`, sorted. Because of the breadth-first numbering, the child stored at
+    position `p` of `tokens` is node `p + 1`.
+    The arrays can be saved once and opened with memory mapping, so the trie loads instantly and is shared
+    by all the processes using it. E.g.: `ArrayTrie.from_trie(load_wikipedia_trie()).save(path)`
+    and then `LinkerRegen(trie=ArrayTrie.load(path))`
+    """
+
+    def __init__(self, offsets: np.ndarray, tokens: np.ndarray):
+        """
+        :param offsets: Start of the children of each node in `tokens`, plus the total number of children
+        :param tokens: Tokens of the children of each node
+        """
+        self.offsets = offsets
+        self.tokens = tokens
+
+    def __deepcopy__(self, memo):
+        # The trie is read-only, so copies share it instead of loading the (memory mapped) arrays in memory
+        return self
+
+    @classmethod
+    def from_trie(cls, trie: Trie) -> "ArrayTrie":
+        """
+        Build the array trie of a trie
+        :param trie: Trie to convert
+        :return: The array trie
+        """
+        offsets = [0]
+        tokens = []
+        nodes = deque([trie.trie_dict])
+        while nodes:
+            node = nodes.popleft()
+            for idx in sorted(node):
+                tokens.append(idx)
+                nodes.append(node[idx])
+            offsets.append(len(tokens))
+        return cls(np.array(offsets, dtype=np.int64), np.array(tokens, dtype=np.int32))
+
+    @classmethod
+    def from_sequences(cls, sequences: Collection[Collection[int]]) -> "ArrayTrie":
+        """
+        Build the array trie of a collection of sequences
+        :param sequences: Sequences of tokens
+        :return: The array trie
+        """
+        return cls.from_trie(Trie(sequences))
+
+    def save(self, path: Union[str, os.PathLike]):
+        """
+        Save the arrays of the trie in a directory
+        :param path: Directory to save the trie in
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, OFFSETS_FILE_NAME), self.offsets)
+        np.save(os.path.join(path, TOKENS_FILE_NAME), self.tokens)
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike], mmap: bool = True) -> "ArrayTrie":
+        """
+        Load a trie saved with `save`
+        :param path: Directory of the trie
+        :param mmap: If True, the arrays are memory mapped in read-only mode instead of read into memory
+        :return: The array trie
+        """
+        mmap_mode = "r" if mmap else None
+        return cls(np.load(os.path.join(path, OFFSETS_FILE_NAME), mmap_mode=mmap_mode),
+                   np.load(os.path.join(path, TOKENS_FILE_NAME), mmap_mode=mmap_mode))
+
+    def postfix(self, prefix_sequence: Collection[int]) -> List[int]:
+        node = self.root
+        for pfx in list(prefix_sequence)[1:]:
+            node = self.child(node, pfx)
+            if node is None:
+                return []
+        return self.children(node)
+
+    @property
+    def root(self) -> int:
+        """ Root node of the trie """
+        return 0
+
+    def child(self, node: int, idx: int) -> Optional[int]:
+        """
+        Get the child of a node
+        :param node: Node of the trie
+        :param idx: Token of the child
+        :return: The child node or None if the node has no child with that token
+        """
+        start, end = self.offsets[node], self.offsets[node + 1]
+        position = start + np.searchsorted(self.tokens[start:end], idx)
+        if position < end and self.tokens[position] == idx:
+            return int(position) + 1
+        return None
+
+    def children(self, node: int) -> List[int]:
+        """
+        Get the tokens of the children of a node
+        :param node: Node of the trie
+        :return: List of tokens that can follow the node
+        """
+        return self.tokens[self.offsets[node]:self.offsets[node + 1]].tolist()
+
+    def cursor(self) -> "TrieCursor":
+        """
+        Create a cursor to get the postfixes of growing prefixes incrementally
+        :return: A new cursor with an empty cache
+        """
+        return TrieCursor(self)
+
+
+class TrieCursor(object):
+    """ Incremental access to the postfixes of a trie.
+    The node reached by each prefix is cached, so the postfix of a prefix that extends a cached one
+    only needs one step from the parent node, instead of walking the trie from the root.
+    Prefixes are cached by their tuple, so each lookup still converts and hashes the whole prefix
+    (and slices it to find the parent on a cache miss). That is O(prefix length) per lookup, but done in C,
+    while the walk over the trie in Python is O(1) plus the number of children, instead of O(prefix length).
+    The cache grows with every prefix seen, so a new cursor should be used for each generation.
+    """
+
+    def __init__(self, trie: Union[Trie, ArrayTrie]):
+        self.trie = trie
+        self.nodes: Dict[Tuple[int, ...], Optional[Any]] = {}
+
+    def node(self, prefix: Tuple[int, ...]) -> Optional[Any]:
+        """
+        Get the node reached by a prefix. As in `Trie.postfix`, the first token of the prefix
+        (decoder start token) is not part of the trie. If the parent prefix is cached, it takes one step
+        of the trie, plus hashing the prefix and its parent
+        :param prefix: Prefix sequence
+        :return: The node reached by the prefix or None if the prefix is not in the trie
+        """
+        if prefix in self.nodes:
+            return self.nodes[prefix]
+        if len(prefix) <= 1:
+            node = self.trie.root
+        else:
+            parent = self.node(prefix[:-1])
+            node = None if parent is None else self.trie.child(parent, prefix[-1])
+        self.nodes[prefix] = node
+        return node
+
+    def postfix(self, prefix_sequence: Collection[int]) -> List[int]:
+        """
+        Get the tokens that can follow a prefix
+        :param prefix_sequence: Prefix sequence
+        :return: List of tokens that can follow the prefix
+        """
+        node = self.node(tuple(prefix_sequence))
+        return [] if node is None else self.trie.children(node)
@@ -1,16 +1,20 @@
-from typing import Iterator, List, Optional, Union
+from typing import Iterator, List, Optional, Tuple, Union
 
 from spacy.tokens import Doc
 from transformers import BertTokenizerFast
 
 from zshot.config import MODELS_CACHE_PATH
 from zshot.linker.linker import Linker
-from zshot.utils.data_models import Span
+from zshot.utils.data_models import Entity, Span, SpanBatch
+from zshot.utils.models.smxm.data import EncodedDescriptions
 from zshot.utils.models.smxm.model import BertTaggerMultiClass
 from zshot.utils.models.smxm.utils import (
     get_entities_names_descriptions,
-    smxm_predict
+    smxm_predict,
+    smxm_predict_variants,
+    union_descriptions
 )
+from zshot.utils.versioning import kg_version
 
 ONTONOTES_MODEL_NAME = "ibm/smxm"
 
@@ -18,7 +22,12 @@ ONTONOTES_MODEL_NAME = "ibm/smxm"
 class LinkerSMXM(Linker):
     """ SMXM linker """
 
-    def __init__(self, model_name=ONTONOTES_MODEL_NAME):
+    def __init__(self, model_name=ONTONOTES_MODEL_NAME, chunk_size: Optional[int] = None):
+        """
+        :param model_name: SMXM model to use
+        :param chunk_size: Max number of (sentence, description) pairs encoded in a single forward pass.
+        If None, as many pairs as sentences in a batch are encoded at once
+        """
         super().__init__()
 
         self.tokenizer = BertTokenizerFast.from_pretrained(
@@ -26,7 +35,12 @@ class LinkerSMXM(Linker):
         )
 
         self.model_name = model_name
+        self.chunk_size = chunk_size
         self.model = None
+        self._encoded_descriptions = None
+        self._encoded_descriptions_version = None
+        self._variants_encoded_descriptions = None
+        self._variants_encoded_descriptions_version = None
 
     @property
     def is_end2end(self) -> bool:
@@ -41,17 +55,22 @@ class LinkerSMXM(Linker):
             ).to(self.device)
             self.model.eval()
 
-    def predict(self, docs: Iterator[Doc], batch_size: Optional[Union[int, None]] = None) -> List[List[Span]]:
+    def predict(self, docs: Iterator[Doc],
+                batch_size: Optional[Union[int, None]] = None) -> Union[List[List[Span]], SpanBatch]:
         """
         Perform the entity prediction
         :param docs: A list of spacy Document
         :param batch_size: The batch size
-        :return: List Spans for each Document in docs
+        :return: SpanBatch with the Spans of all the Documents, or an empty list if there are no entities
         """
         if not self._entities:
             return []
 
         entity_labels, entity_descriptions = get_entities_names_descriptions(self._entities)
+        if self._encoded_descriptions_version != self.entities_version:
+            # Descriptions are only tokenized again when the entities change
+            self._encoded_descriptions = EncodedDescriptions(entity_descriptions, self.tokenizer)
+            self._encoded_descriptions_version = self.entities_version
         sentences = [doc.text for doc in docs]
 
         self.load_models()
@@ -59,6 +78,49 @@ class LinkerSMXM(Linker):
 
         span_annotations = smxm_predict(self.model, self.tokenizer,
                                         sentences, entity_labels, entity_descriptions,
-                                        batch_size)
+                                        batch_size, chunk_size=self.chunk_size,
+                                        encoded_descriptions=self._encoded_descriptions,
+                                        max_tokens=self.batch_max_tokens)
+
+        return span_annotations
+
+    def predict_variants(self, docs: Iterator[Doc], entities_variants: List[List[Entity]],
+                         batch_size: Optional[Union[int, None]] = None,
+                         variants_versions: Optional[Tuple] = None) -> List[Union[List[List[Span]], SpanBatch]]:
+        """
+        Perform the entity prediction with several sets of entities, e.g. the description variants of an ensemble.
+        Each (sentence, description) pair is encoded once, even if it is used by several sets
+        :param docs: A list of spacy Document
+        :param entities_variants: Sets of entities to use
+        :param batch_size: The batch size
+        :param variants_versions: Version of each set of entities (e.g. the `entities_version` of each voter).
+        If None, it is computed from the entities
+        :return: SpanBatch with the Spans of all the Documents for each set of entities,
+        or an empty list for the sets without entities
+        """
+        variants_idx = [i for i, entities in enumerate(entities_variants) if entities]
+        span_annotations = [[] for _ in entities_variants]
+        if not variants_idx:
+            return span_annotations
+
+        variants = [get_entities_names_descriptions(list(entities_variants[i])) for i in variants_idx]
+        if variants_versions is None:
+            variants_versions = tuple(kg_version(entities) for entities in entities_variants)
+        if self._variants_encoded_descriptions_version != variants_versions:
+            # The union of the descriptions is only tokenized again when a set of entities changes
+            _, all_descriptions, _ = union_descriptions(variants)
+            self._variants_encoded_descriptions = EncodedDescriptions(all_descriptions, self.tokenizer)
+            self._variants_encoded_descriptions_version = variants_versions
+        sentences = [doc.text for doc in docs]
+
+        self.load_models()
+        self.model.eval()
 
+        variants_span_annotations = smxm_predict_variants(self.model, self.tokenizer,
+                                                          sentences, variants,
+                                                          batch_size, chunk_size=self.chunk_size,
+                                                          encoded_descriptions=self._variants_encoded_descriptions,
+                                                          max_tokens=self.batch_max_tokens)
+        for i, variant_span_annotations in zip(variants_idx, variants_span_annotations):
+            span_annotations[i] = variant_span_annotations
         return span_annotations
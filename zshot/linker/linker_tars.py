@@ -1,4 +1,5 @@
 import pkgutil
+import threading
 from typing import Iterator, Optional, Union, List
 
 from spacy.tokens.doc import Doc
@@ -7,6 +8,10 @@ from zshot.linker.linker import Linker
 from zshot.utils.models.tars.utils import tars_predict
 from zshot.utils.data_models import Entity, Span
 
+# The copies of a linker (e.g. the voters of an ensemble) share the TARS model, whose current task is switched
+# before each prediction. Predictions are serialized so a copy doesn't switch the task while another one predicts
+_TASK_LOCK = threading.Lock()
+
 
 class LinkerTARS(Linker):
     """ TARS end2end Linker """
@@ -31,14 +36,14 @@ class LinkerTARS(Linker):
         self.task = None
 
     def set_kg(self, entities: Iterator[Entity]):
-        """ Set new entities in the model
+        """ Set new entities in the model. The TARS task is only switched if the entities changed
 
         :param entities: New entities to use
         """
-        old_entities = self.entities
+        old_version = self.entities_version
         super().set_kg(entities)
         self.flat_entities()
-        if old_entities != entities:
+        if self.entities_version != old_version:
             self.task = f'zshot.ner.{hash(tuple(self.entities))}'
             if not self.model:
                 self.load_models()
@@ -84,6 +89,9 @@ class LinkerTARS(Linker):
             Sentence(str(doc), use_tokenizer=True) for doc in docs
         ]
 
-        spans_annotations = tars_predict(self.model, sentences, batch_size)
+        with _TASK_LOCK:
+            # The shared model may have been switched to the task of other entities
+            self.model.switch_to_task(self.task)
+            spans_annotations = tars_predict(self.model, sentences, batch_size)
 
         return spans_annotations
@@ -12,14 +12,18 @@ from typing import List, Iterator, Optional, Union
 from spacy.util import ensure_path
 
 from zshot.utils.data_models import Entity
-from zshot.utils.data_models import Span
+from zshot.utils.data_models import Span, SpanBatch
+from zshot.utils.data_models.span_batch import as_spans
+from zshot.utils.versioning import KGVersion, kg_version
 
 
 class MentionsExtractor(ABC):
 
     def __init__(self, device: Optional[Union[str, torch.device]] = None):
         self._mentions = None
+        self._mentions_version = None
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu") if device is None else device
+        self.batch_max_tokens = None
 
     def set_device(self, device: Union[str, torch.device]):
         """
@@ -29,17 +33,31 @@ class MentionsExtractor(ABC):
         """
         self.device = device
 
+    def set_batch_max_tokens(self, batch_max_tokens: Optional[int]):
+        """
+        Set the max number of tokens (including padding) in a batch. When set, inputs are sorted by length
+        and packed into batches up to this budget instead of batches of `batch_size` documents
+        :param batch_max_tokens: Max number of tokens in a batch, or None to batch by number of documents
+        """
+        self.batch_max_tokens = batch_max_tokens
+
     def set_kg(self, mentions: Iterator[Entity]):
         """
         Set entities that mention extractor can use
         :param mentions: The list of entities
         """
         self._mentions = mentions
+        self._mentions_version = kg_version(mentions)
 
     @property
     def mentions(self) -> List[Entity]:
         return self._mentions
 
+    @property
+    def mentions_version(self) -> Optional[KGVersion]:
+        """ Version stamp of the mentions. It only changes when the content of the mentions changes """
+        return self._mentions_version
+
     def load_models(self):
         """
         Load the model
@@ -54,7 +72,7 @@ class MentionsExtractor(ABC):
         :param batch_size: The batch size
         :return:
         """
-        predictions_spans = self.predict(docs, batch_size)
+        predictions_spans = as_spans(self.predict(docs, batch_size))
         for doc, doc_preds in zip(docs, predictions_spans):
             for pred in doc_preds:
                 try:
@@ -63,12 +81,12 @@ class MentionsExtractor(ABC):
                     warnings.warn("Entity couldn't be added.")
 
     @abstractmethod
-    def predict(self, docs: Iterator[Doc], batch_size=None) -> List[List[Span]]:
+    def predict(self, docs: Iterator[Doc], batch_size=None) -> Union[List[List[Span]], SpanBatch]:
         """
         Perform the mentions prediction
         :param docs: A list of spacy Document
         :param batch_size: The batch size
-        :return:
+        :return: List Spans for each Document in docs, or a SpanBatch with the Spans of all the Documents
         """
         pass
 
@@ -7,7 +7,9 @@ from gliner import GLiNER
 
 from zshot.mentions_extractor.mentions_extractor import MentionsExtractor
 from zshot.config import MODELS_CACHE_PATH
-from zshot.utils.data_models import Span
+from zshot.utils.batching import make_batches
+from zshot.utils.data_models import Span, SpanBatch
+from zshot.utils.models.gliner.utils import gliner_predict
 
 
 MODEL_NAME = "urchade/gliner_mediumv2.1"
@@ -16,7 +18,13 @@ MODEL_NAME = "urchade/gliner_mediumv2.1"
 class MentionsExtractorGLINER(MentionsExtractor):
     """ GLiNER Mentions Extractor """
 
-    def __init__(self, model_name=MODEL_NAME):
+    def __init__(self, model_name=MODEL_NAME, threshold: float = 0.5, flat_ner: bool = True, multi_label: bool = False):
+        """
+        :param model_name: Name of the GLiNER model
+        :param threshold: Min score of the predicted spans
+        :param flat_ner: If True, overlapping spans are not allowed
+        :param multi_label: If True, a span can have more than one label
+        """
         super().__init__()
 
         if not pkgutil.find_loader("gliner"):
@@ -24,6 +32,9 @@ class MentionsExtractorGLINER(MentionsExtractor):
                             "Install it with: pip install gliner")
 
         self.model_name = model_name
+        self.threshold = threshold
+        self.flat_ner = flat_ner
+        self.multi_label = multi_label
         self.model = None
 
     def load_models(self):
@@ -32,23 +43,22 @@ class MentionsExtractorGLINER(MentionsExtractor):
             self.model = GLiNER.from_pretrained(self.model_name, cache_dir=MODELS_CACHE_PATH).to(self.device)
             self.model.eval()
 
-    def predict(self, docs: Iterator[Doc], batch_size: Optional[Union[int, None]] = None) -> List[List[Span]]:
+    def predict(self, docs: Iterator[Doc],
+                batch_size: Optional[Union[int, None]] = None) -> Union[List[List[Span]], SpanBatch]:
         """
         Perform the entity prediction
         :param docs: A list of spacy Document
         :param batch_size: The batch size
-        :return: List Spans for each Document in docs
+        :return: SpanBatch with the Spans of all the Documents, or an empty list if there are no mentions
         """
         if not self._mentions:
             return []
 
         labels = [ent.name for ent in self._mentions]
+        docs = list(docs)
         sentences = [doc.text for doc in docs]
+        batches = make_batches([len(doc) for doc in docs], batch_size, self.batch_max_tokens)
 
         self.load_models()
-        span_annotations = []
-        for sent in sentences:
-            entities = self.model.predict_entities(sent, labels, threshold=0.5)
-            span_annotations.append([Span.from_dict(ent) for ent in entities])
-
-        return span_annotations
+        return gliner_predict(self.model, sentences, labels, batches, flat_ner=self.flat_ner,
+                              threshold=self.threshold, multi_label=self.multi_label)
@@ -5,7 +5,8 @@ from transformers import BertTokenizerFast
 
 from zshot.config import MODELS_CACHE_PATH
 from zshot.mentions_extractor.mentions_extractor import MentionsExtractor
-from zshot.utils.data_models import Span
+from zshot.utils.data_models import Span, SpanBatch
+from zshot.utils.models.smxm.data import EncodedDescriptions
 from zshot.utils.models.smxm.model import BertTaggerMultiClass
 from zshot.utils.models.smxm.utils import (
     get_entities_names_descriptions,
@@ -18,7 +19,12 @@ ONTONOTES_MODEL_NAME = "ibm/smxm"
 class MentionsExtractorSMXM(MentionsExtractor):
     """ SMXM Mentions Extractor """
 
-    def __init__(self, model_name=ONTONOTES_MODEL_NAME):
+    def __init__(self, model_name=ONTONOTES_MODEL_NAME, chunk_size: Optional[int] = None):
+        """
+        :param model_name: SMXM model to use
+        :param chunk_size: Max number of (sentence, description) pairs encoded in a single forward pass.
+        If None, as many pairs as sentences in a batch are encoded at once
+        """
         super().__init__()
 
         self.tokenizer = BertTokenizerFast.from_pretrained(
@@ -26,7 +32,10 @@ class MentionsExtractorSMXM(MentionsExtractor):
         )
 
         self.model_name = model_name
+        self.chunk_size = chunk_size
         self.model = None
+        self._encoded_descriptions = None
+        self._encoded_descriptions_version = None
 
     def load_models(self):
         """ Load SMXM model """
@@ -36,17 +45,22 @@ class MentionsExtractorSMXM(MentionsExtractor):
             ).to(self.device)
             self.model.eval()
 
-    def predict(self, docs: Iterator[Doc], batch_size: Optional[Union[int, None]] = None) -> List[List[Span]]:
+    def predict(self, docs: Iterator[Doc],
+                batch_size: Optional[Union[int, None]] = None) -> Union[List[List[Span]], SpanBatch]:
         """
         Perform the entity prediction
         :param docs: A list of spacy Document
         :param batch_size: The batch size
-        :return: List Spans for each Document in docs
+        :return: SpanBatch with the Spans of all the Documents, or an empty list if there are no mentions
         """
         if not self._mentions:
             return []
 
         entity_labels, entity_descriptions = get_entities_names_descriptions(self._mentions)
+        if self._encoded_descriptions_version != self.mentions_version:
+            # Descriptions are only tokenized again when the mentions change
+            self._encoded_descriptions = EncodedDescriptions(entity_descriptions, self.tokenizer)
+            self._encoded_descriptions_version = self.mentions_version
         sentences = [doc.text for doc in docs]
 
         self.load_models()
@@ -54,6 +68,8 @@ class MentionsExtractorSMXM(MentionsExtractor):
 
         span_annotations = smxm_predict(self.model, self.tokenizer,
                                         sentences, entity_labels, entity_descriptions,
-                                        batch_size)
+                                        batch_size, chunk_size=self.chunk_size,
+                                        encoded_descriptions=self._encoded_descriptions,
+                                        max_tokens=self.batch_max_tokens)
 
         return span_annotations
@@ -31,14 +31,14 @@ class MentionsExtractorTARS(MentionsExtractor):
         self.task = None
 
     def set_kg(self, mentions: Iterator[Entity]):
-        """ Set new entities in the model
+        """ Set new entities in the model. The TARS task is only switched if the entities changed
 
         :param mentions: New entities to use
         """
-        old_entities = self._mentions
+        old_version = self.mentions_version
         super().set_kg(mentions)
-        if old_entities != mentions:
-            self.flat_entities()
+        self.flat_entities()
+        if self.mentions_version != old_version:
             self.task = f'zshot.ner.{hash(tuple(self._mentions))}'
             if not self.model:
                 self.load_models()
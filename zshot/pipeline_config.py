@@ -21,7 +21,8 @@ class PipelineConfig(dict):
                  entities: Optional[Union[List[Entity], List[str], str]] = None,
                  relations: Optional[Union[List[Relation], str]] = None,
                  disable_default_ner: Optional[bool] = True,
-                 device: Optional[str] = None) -> None:
+                 device: Optional[str] = None,
+                 batch_max_tokens: Optional[int] = None) -> None:
         config = {}
 
         if mentions_extractor:
@@ -58,6 +59,9 @@ class PipelineConfig(dict):
         if device:
             config.update({'device': device})
 
+        if batch_max_tokens:
+            config.update({'batch_max_tokens': batch_max_tokens})
+
         super().__init__(**config)
 
     @staticmethod
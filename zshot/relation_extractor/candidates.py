@@ -0,0 +1,71 @@
+from bisect import bisect_right
+from typing import List, Tuple
+
+from spacy.tokens import Doc
+
+from zshot.utils.data_models import Relation, Span
+
+
+def _sentence_ids(doc: Doc, spans: List[Span]) -> List[int]:
+    """ Index of the sentence of each span. Without sentence boundaries, the doc is a single sentence """
+    if not doc.has_annotation("SENT_START"):
+        return [0] * len(spans)
+    sentence_starts = [sent.start_char for sent in doc.sents]
+    return [bisect_right(sentence_starts, span.start) - 1 for span in spans]
+
+
+def candidate_pairs(doc: Doc, relations: List[Relation]) -> List[List[Tuple[Span, Span, int]]]:
+    """
+    Enumerate the candidate relations between the entities (`doc._.spans`) of a document.
+    Each pair of entities is considered once. A relation is a candidate for a pair if the labels of the entities
+    are allowed as subject and object of the relation, in any direction, and the entities are within its
+    max char and sentence distances. Pairs farther than the max char distance of all the relations
+    are never enumerated
+    :param doc: Document with the entities
+    :param relations: Relations to consider
+    :return: For each pair with any candidate relation, the candidate (subject, object, relation index) items
+    """
+    subject_labels = [None if r.subject_labels is None else set(r.subject_labels) for r in relations]
+    object_labels = [None if r.object_labels is None else set(r.object_labels) for r in relations]
+    allowed_labels = set()
+    for labels in subject_labels + object_labels:
+        if labels is None:
+            allowed_labels = None
+            break
+        allowed_labels |= labels
+    # Duplicated entities and entities that can't be part of any relation are left out
+    spans = [span for span in dict.fromkeys(doc._.spans) if allowed_labels is None or span.label in allowed_labels]
+    sentence_ids = _sentence_ids(doc, spans)
+    max_char_distance = None if any(r.max_char_distance is None for r in relations) \
+        else max(r.max_char_distance for r in relations)
+
+    def allowed(relation_idx: int, subject: Span, obj: Span) -> bool:
+        return ((subject_labels[relation_idx] is None or subject.label in subject_labels[relation_idx])
+                and (object_labels[relation_idx] is None or obj.label in object_labels[relation_idx]))
+
+    pairs = []
+    order = sorted(range(len(spans)), key=lambda idx: spans[idx].start)
+    for k, idx in enumerate(order):
+        for other_idx in order[k + 1:]:
+            # Entities are sorted by start, so the next ones are even farther
+            if max_char_distance is not None and spans[other_idx].start - spans[idx].end > max_char_distance:
+                break
+            i, j = min(idx, other_idx), max(idx, other_idx)
+            e1, e2 = spans[i], spans[j]
+            char_distance = max(0, e2.start - e1.end, e1.start - e2.end)
+            sentence_distance = abs(sentence_ids[i] - sentence_ids[j])
+            items = []
+            for relation_idx, relation in enumerate(relations):
+                if ((relation.max_char_distance is not None and char_distance > relation.max_char_distance)
+                        or (relation.max_sentence_distance is not None
+                            and sentence_distance > relation.max_sentence_distance)):
+                    continue
+                if allowed(relation_idx, e1, e2):
+                    items.append((e1, e2, relation_idx))
+                elif allowed(relation_idx, e2, e1):
+                    items.append((e2, e1, relation_idx))
+            if items:
+                pairs.append((i, j, items))
+    # Keep the order of the entities in the document
+    pairs.sort(key=lambda pair: (pair[0], pair[1]))
+    return [items for _, _, items in pairs]
@@ -1,23 +1,42 @@
+from bisect import bisect_right
+
 import torch
 from torch.utils.data import DataLoader
 
+from zshot.relation_extractor.candidates import candidate_pairs
 from zshot.relation_extractor.relations_extractor import RelationsExtractor
 from zshot.relation_extractor.zsrc import data_helper
+from zshot.relation_extractor.zsrc.decide_entity_order import EntityOrderScorer
 from zshot.relation_extractor.zsrc.zero_shot_rel_class import load_model
+from zshot.utils.batching import make_batches
 import numpy as np
 from tqdm import tqdm
-from typing import Iterator, List
+from typing import Iterator, List, Optional
 from spacy.tokens import Doc
 
 from zshot.utils.data_models.relation_span import RelationSpan
 
 
 class RelationsExtractorZSRC(RelationsExtractor):
-    def __init__(self, thr=0.5):
+    def __init__(self, thr=0.5, batch_size=16, max_context_tokens=None,
+                 entity_order_scorer: Optional[EntityOrderScorer] = None):
+        """
+        :param thr: Min score of the predicted relations
+        :param batch_size: Number of (entity pair, relation) items in each forward pass. The batch size given
+        to predict is a number of documents, so it isn't used for the items
+        :param max_context_tokens: Max number of tokens of the context of each entity pair. If the doc has
+        sentence boundaries, the context is the sentences that contain the pair. Contexts longer than this,
+        or than the max input length of the model, are cut around the entities
+        :param entity_order_scorer: If given, the NLI scorer is used after the prediction to fix the order
+        of the entities of each relation (and to drop negated relations, if the scorer is set to)
+        """
         super().__init__()
         self.model = None
         self.load_models()
         self.thr = thr
+        self.batch_size = batch_size
+        self.max_context_tokens = max_context_tokens
+        self.entity_order_scorer = entity_order_scorer
 
     def load_models(
             self,
@@ -26,63 +45,85 @@ class RelationsExtractorZSRC(RelationsExtractor):
             self.model = load_model(self.device)
 
     def predict(self, docs: Iterator[Doc], batch_size=None) -> List[List[RelationSpan]]:
-        relations_pred = []
-        for doc in tqdm(docs, desc='classifying documents'):
-            relations_doc = []
-            items_to_process = []
-            for i, e1 in enumerate(doc._.spans):
-                for j, e2 in enumerate(doc._.spans):
-                    if (
-                            i == j or (e1, e2) in items_to_process or (
-                            e2, e1) in items_to_process
-                    ):
-                        continue
-                    else:
-                        items_to_process.append((e1, e2))
+        docs = list(docs)
+        relations_pred = [[] for _ in docs]
+        if not self.relations:
+            return relations_pred
+
+        # Enumerate the candidate (entity pair, relation) items of all the docs, so they are classified in batches
+        pairs = []
+        items_to_process = []
+        relations_descriptions = []
+        for doc_id, doc in enumerate(docs):
+            sentences = [(sent.start_char, sent.end_char) for sent in doc.sents] \
+                if doc.has_annotation("SENT_START") else None
+            for pair_items in candidate_pairs(doc, self.relations):
+                pairs.append((doc_id, pair_items))
+                for e1, e2, relation_idx in pair_items:
+                    window = self._sentences_window(sentences, e1, e2) if sentences else None
+                    items_to_process.append((e1, e2, doc.text, window))
+                    relations_descriptions.append(self.relations[relation_idx].description)
+        if not pairs:
+            return relations_pred
 
-                    relations_probs = []
-                    if self.relations is not None:
-                        for rel in self.relations:
-                            _, probs = self._predict_internal(
-                                [(e1, e2, doc.text)],
-                                rel.description,
-                                batch_size,
-                            )
-                            relations_probs.append(probs[0])
-                        pred_class_idx = np.argmax(np.array(relations_probs))
-                        p = relations_probs[pred_class_idx]
-                        if p >= self.thr:
-                            relations_doc.append(
-                                RelationSpan(
-                                    start=e1, end=e2, score=p, relation=self.relations[pred_class_idx])
-                            )
-            relations_pred.append(relations_doc)
+        _, probs = self._predict_internal(items_to_process, relations_descriptions)
+        # The items of each pair are consecutive, one for each candidate relation
+        offset = 0
+        for doc_id, pair_items in pairs:
+            pair_probs = probs[offset:offset + len(pair_items)]
+            offset += len(pair_items)
+            pred_idx = np.argmax(pair_probs)
+            p = pair_probs[pred_idx]
+            if p >= self.thr:
+                e1, e2, relation_idx = pair_items[pred_idx]
+                relations_pred[doc_id].append(
+                    RelationSpan(
+                        start=e1, end=e2, score=p, relation=self.relations[relation_idx])
+                )
+        if self.entity_order_scorer is not None:
+            relations_pred = self.entity_order_scorer.postprocess(docs, relations_pred)
         return relations_pred
 
-    def _predict_internal(self, items_to_process, relation_description, batch_size=4):
-        trainset = data_helper.ZSDataset(
-            'test', items_to_process, relation_description)
-        trainloader = DataLoader(trainset, batch_size=batch_size,
-                                 collate_fn=data_helper.create_mini_batch_fewrel_aio, shuffle=False)
-        all_preds = []
-        all_probs = []
-        for data in trainloader:
+    @staticmethod
+    def _sentences_window(sentences, e1, e2):
+        """ Start and end chars of the sentences that contain both entities """
+        first = bisect_right(sentences, (min(e1.start, e2.start), float("inf"))) - 1
+        last = bisect_right(sentences, (max(e1.end, e2.end) - 1, float("inf"))) - 1
+        return sentences[max(first, 0)][0], sentences[max(last, 0)][1]
+
+    def _predict_internal(self, items_to_process, relations_descriptions):
+        """
+        Classify (entity pair, relation) items
+        :param items_to_process: List of (entity 1, entity 2, text, context window) items
+        :param relations_descriptions: Description of the relation of each item
+        :return: Prediction and probability of each item. Items longer than the max input length are not
+        classified and get a probability of -1
+        """
+        testset = data_helper.ZSDataset(
+            'test', items_to_process, relations_descriptions, max_context_tokens=self.max_context_tokens)
+        # Items are only built when their batch is loaded, so the memory used is bounded by the batch size
+        lengths = [testset.item_length(i) for i in range(len(testset))]
+        valid_items = [i for i, length in enumerate(lengths) if length <= data_helper.MAX_LENGTH]
+        batches = [[valid_items[i] for i in batch]
+                   for batch in make_batches([lengths[i] for i in valid_items], self.batch_size,
+                                             self.batch_max_tokens)]
+        testloader = DataLoader(testset, batch_sampler=batches,
+                                collate_fn=data_helper.create_mini_batch_fewrel_aio)
+        all_probs = [-1] * len(testset)
+        for batch, data in zip(batches, tqdm(testloader, desc='classifying relations')):
             tokens_tensors, segments_tensors, marked_e1, marked_e2, masks_tensors, labels = [
                 t.to(self.device) for t in data]
-            if tokens_tensors.shape[1] <= 512:
-                with torch.no_grad():
-                    outputs = self.model(input_ids=tokens_tensors,
-                                         token_type_ids=segments_tensors,
-                                         e1_mask=marked_e1,
-                                         e2_mask=marked_e2,
-                                         attention_mask=masks_tensors,
-                                         labels=labels)
-                    preds = outputs[1]
-                    probs = preds.detach().cpu().numpy()[:, 1]
-                    all_probs.extend(probs)
-                    all_preds.extend([item >= 0.5 for item in probs])
-            else:
-                all_probs.extend([-1] * tokens_tensors.shape[0])
-                all_preds.extend([False] * tokens_tensors.shape[0])
+            with torch.no_grad():
+                outputs = self.model(input_ids=tokens_tensors,
+                                     token_type_ids=segments_tensors,
+                                     e1_mask=marked_e1,
+                                     e2_mask=marked_e2,
+                                     attention_mask=masks_tensors,
+                                     labels=labels)
+                preds = outputs[1]
+                probs = preds.detach().cpu().numpy()[:, 1]
+            for idx, prob in zip(batch, probs):
+                all_probs[idx] = prob
+        all_preds = [prob >= 0.5 for prob in all_probs]
 
         return all_preds, all_probs
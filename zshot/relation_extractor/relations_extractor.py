@@ -10,13 +10,16 @@ from spacy.util import ensure_path
 
 from zshot.utils.data_models.relation import Relation
 from zshot.utils.data_models.relation_span import RelationSpan
+from zshot.utils.versioning import KGVersion, kg_version
 
 
 class RelationsExtractor(ABC):
 
     def __init__(self, device: Optional[Union[str, torch.device]] = None):
         self._relations = None
+        self._relations_version = None
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu") if device is None else device
+        self.batch_max_tokens = None
 
     def set_device(self, device: Union[str, torch.device]):
         """
@@ -26,17 +29,31 @@ class RelationsExtractor(ABC):
         """
         self.device = device
 
+    def set_batch_max_tokens(self, batch_max_tokens: Optional[int]):
+        """
+        Set the max number of tokens (including padding) in a batch. When set, inputs are sorted by length
+        and packed into batches up to this budget instead of batches of `batch_size` documents
+        :param batch_max_tokens: Max number of tokens in a batch, or None to batch by number of documents
+        """
+        self.batch_max_tokens = batch_max_tokens
+
     def set_relations(self, relations: Iterator[Relation]):
         """
         Set relationships that the relations extractor can use
         :param relations: The list of relationship
         """
         self._relations = relations
+        self._relations_version = kg_version(relations)
 
     @property
     def relations(self) -> List[Relation]:
         return self._relations
 
+    @property
+    def relations_version(self) -> Optional[KGVersion]:
+        """ Version stamp of the relations. It only changes when the content of the relations changes """
+        return self._relations_version
+
     def load_models(self):
         """
         Load the model
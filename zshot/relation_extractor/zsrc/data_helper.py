@@ -1,21 +1,98 @@
 # import pdb
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import Optional, Tuple
+
 import numpy as np
 import torch
 from torch.nn.utils.rnn import pad_sequence
 from torch.utils.data import Dataset
 from transformers import BertTokenizerFast
 
+TOKENIZER_NAME = "bert-base-cased"
+MAX_LENGTH = 512
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer() -> BertTokenizerFast:
+    """ Tokenizer of ZSRC, loaded once and shared by all the datasets of the process """
+    return BertTokenizerFast.from_pretrained(TOKENIZER_NAME, do_lower_case=False)
+
 
 class ZSDataset(Dataset):
-    def __init__(self, mode, data, rel_desc):
+    def __init__(self, mode, data, rel_desc, tokenizer=None, max_context_tokens: Optional[int] = None):
+        """
+        :param mode: Dataset mode (train, dev or test)
+        :param data: List of (entity 1, entity 2, sentence) items. Items can have a fourth element with the
+        (start, end) chars of the context window of the entities, e.g. the sentences that contain them
+        :param rel_desc: Relation description of each item
+        :param tokenizer: Tokenizer to use. If None, the shared ZSRC tokenizer is used
+        :param max_context_tokens: Max number of sentence tokens around the entities. The context is always
+        limited to fit in the max input length of the model
+        """
         assert mode in ["train", "dev", "test"]
         self.mode = mode
         self.data = data
         self.rel_desc = rel_desc
         self.len = len(data)
-        self.tokenizer = BertTokenizerFast.from_pretrained(
-            "bert-base-cased", do_lower_case=False
-        )
+        self.tokenizer = tokenizer if tokenizer is not None else get_tokenizer()
+        self.max_context_tokens = max_context_tokens
+        # Each sentence and description is tokenized once, in a single call, and shared by all its items
+        sentences = list(dict.fromkeys(g[2] for g in data))
+        self.sentence_encodings = dict(zip(sentences, self.tokenizer(sentences, return_offsets_mapping=True)
+                                           .encodings)) if sentences else {}
+        # Start and end chars of the tokens of each sentence, without [CLS] and [SEP], to find the context windows
+        self.sentence_tokens_bounds = {
+            sentence: ([start for start, _ in encodings.offsets[1:-1]], [end for _, end in encodings.offsets[1:-1]])
+            for sentence, encodings in self.sentence_encodings.items()
+        }
+        descriptions = list(dict.fromkeys(rel_desc))
+        self.description_tokens = dict(zip(descriptions, self.tokenizer(descriptions, add_special_tokens=False)
+                                           .encodings)) if descriptions else {}
+
+    def context_window(self, sentence, e1_span, e2_span, window=None, description_len=0) -> Tuple[int, int]:
+        """
+        Get the tokens of the sentence used as context of an entity pair. The context is the window
+        (or the whole sentence) if it fits, otherwise it is cut to the max number of tokens, centred on the entities
+        :param sentence: Sentence of the entities
+        :param e1_span: (start, end) chars of the first entity
+        :param e2_span: (start, end) chars of the second entity
+        :param window: (start, end) chars of the context window. If None, the whole sentence is used
+        :param description_len: Number of tokens of the relation description
+        :return: Start and end of the context in the tokens of the sentence, without [CLS]
+        """
+        starts, ends = self.sentence_tokens_bounds[sentence]
+        if window is None:
+            window_start, window_end = 0, len(starts)
+        else:
+            window_start, window_end = bisect_right(ends, window[0]), bisect_left(starts, window[1])
+        max_tokens = MAX_LENGTH - description_len - 3
+        if self.max_context_tokens is not None:
+            max_tokens = min(max_tokens, self.max_context_tokens)
+        if window_end - window_start <= max_tokens:
+            return window_start, window_end
+
+        entities_start = bisect_right(ends, min(e1_span[0], e2_span[0]))
+        entities_end = bisect_left(starts, max(e1_span[1], e2_span[1]))
+        if entities_end - entities_start >= max_tokens:
+            # The entities don't fit together, only the tokens between them are used
+            return entities_start, entities_end
+        start = max(window_start, entities_start - (max_tokens - (entities_end - entities_start)) // 2)
+        end = min(window_end, start + max_tokens)
+        return max(window_start, end - max_tokens), end
+
+    def item_length(self, idx) -> int:
+        """
+        Number of tokens of an item, computed from the cached encodings without building its tensors
+        :param idx: Index of the item
+        :return: Length of the input ids of the item
+        """
+        g = self.data[idx]
+        description_len = len(self.description_tokens[self.rel_desc[idx]].ids)
+        context_start, context_end = self.context_window(g[2], (g[0].start, g[0].end), (g[1].start, g[1].end),
+                                                         g[3] if len(g) > 3 else None, description_len)
+        # [CLS] description [SEP] context [SEP]
+        return description_len + context_end - context_start + 3
 
     def mark_sem_entity(
         self,
@@ -62,26 +139,30 @@ class ZSDataset(Dataset):
 
     def __getitem__(self, idx):
         g = self.data[idx]
-        sentence = g[-1]
+        sentence = g[2]
+        window = g[3] if len(g) > 3 else None
 
         e1_span = (g[0].start, g[0].end)
         e2_span = (g[1].start, g[1].end)
-        tokens = self.tokenizer.tokenize(sentence, return_offsets_mapping=True)
-        encodings = self.tokenizer(sentence, return_offsets_mapping=True)
-        # tokens = encodings['input_ids']
-        sentence_tokens_positions = encodings["offset_mapping"]
-
         relation_desc = self.rel_desc[idx]
-        tokenized_relation_desc = self.tokenizer.tokenize(relation_desc)
-        tokens_ids = self.tokenizer.convert_tokens_to_ids(
-            ["[CLS]"] + tokenized_relation_desc + ["[SEP]"] + tokens + ["[SEP]"]
-        )
+        tokenized_relation_desc = self.description_tokens[relation_desc].ids
+
+        encodings = self.sentence_encodings[sentence]
+        context_start, context_end = self.context_window(sentence, e1_span, e2_span, window,
+                                                         len(tokenized_relation_desc))
+        # Context tokens without [CLS] and [SEP]. Their offsets are still in chars of the sentence,
+        # so they match the entity spans
+        tokens = encodings.ids[1 + context_start:1 + context_end]
+        sentence_tokens_positions = [encodings.offsets[0]] + encodings.offsets[1 + context_start:1 + context_end] + \
+            [encodings.offsets[-1]]
+        tokens_ids = [self.tokenizer.cls_token_id] + tokenized_relation_desc + [self.tokenizer.sep_token_id] + \
+            tokens + [self.tokenizer.sep_token_id]
         tokens_tensor = torch.tensor(tokens_ids)
         segments_tensor = torch.tensor(
             [0] * (1 + len(tokens) + 1) + [1] * (len(tokenized_relation_desc) + 1),
             dtype=torch.long,
         )
-        start_of_sentence_tokens = len(["[CLS]"] + tokenized_relation_desc + ["[SEP]"])
+        start_of_sentence_tokens = 1 + len(tokenized_relation_desc) + 1
         marked_e1, marked_e2 = self.mark_sem_entity(
             e1_span,
             e2_span,
@@ -1,33 +1,157 @@
+from functools import lru_cache
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
 import numpy as np
-from transformers import pipeline
+import torch
+from spacy.tokens import Doc
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from zshot.config import MODELS_CACHE_PATH
+from zshot.utils.data_models.relation_span import RelationSpan
 
-classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+MODEL_NAME = "facebook/bart-large-mnli"
+HYPOTHESIS_TEMPLATE = "This example is {}."
 
 
 def softmax(x):
     return np.exp(x) / sum(np.exp(x))
 
 
+class EntityOrderScorer:
+    """ NLI scorer that decides the order of the entities of a relation and detects negated relations.
+    Each (premise, hypothesis) pair is scored by the entailment logit of an NLI model, as the zero-shot
+    classification pipeline does. The model is only loaded when it is first used, and pairs are scored in batches
+    """
+
+    def __init__(self, model_name: str = MODEL_NAME, device: Optional[Union[str, torch.device]] = None,
+                 batch_size: int = 8, drop_negated: bool = False):
+        """
+        :param model_name: Name of the NLI model
+        :param device: Device to use. If None, cuda is used if available
+        :param batch_size: Number of (premise, hypothesis) pairs in each forward pass
+        :param drop_negated: If True, `postprocess` drops the relations whose negation is entailed
+        """
+        self.model_name = model_name
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu") if device is None else device
+        self.batch_size = batch_size
+        self.drop_negated = drop_negated
+        self.model = None
+        self.tokenizer = None
+        self.entailment_id = None
+
+    def set_device(self, device: Union[str, torch.device]):
+        """
+        Set the device to use
+        :param device: Device to use
+        """
+        self.device = device
+        if self.model is not None:
+            self.model.to(device)
+
+    def load_models(self):
+        """ Load the NLI model and tokenizer """
+        if self.tokenizer is None:
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, cache_dir=MODELS_CACHE_PATH)
+        if self.model is None:
+            self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name,
+                                                                            cache_dir=MODELS_CACHE_PATH)
+            self.model.to(self.device)
+            self.model.eval()
+        if self.entailment_id is None:
+            self.entailment_id = next((idx for label, idx in self.model.config.label2id.items()
+                                       if label.lower().startswith("entail")), -1)
+
+    def entailment_scores(self, premises: Sequence[str], hypotheses: Sequence[str]) -> np.ndarray:
+        """
+        Score (premise, hypothesis) pairs
+        :param premises: Premise of each pair
+        :param hypotheses: Hypothesis of each pair. The hypothesis template is applied to them
+        :return: Entailment logit of each pair
+        """
+        self.load_models()
+        scores = []
+        for i in range(0, len(premises), self.batch_size):
+            inputs = self.tokenizer(list(premises[i:i + self.batch_size]),
+                                    [HYPOTHESIS_TEMPLATE.format(h) for h in hypotheses[i:i + self.batch_size]],
+                                    padding=True, truncation="only_first", return_tensors="pt")
+            with torch.no_grad():
+                logits = self.model(input_ids=inputs["input_ids"].to(self.device),
+                                    attention_mask=inputs["attention_mask"].to(self.device)).logits
+            scores.append(logits[:, self.entailment_id].cpu().numpy())
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+    def entity_orders(self, items: Sequence[Tuple[str, str, str, str]]) -> List[bool]:
+        """
+        Decide the order of the entities of relations
+        :param items: List of (premise, entity 1 text, entity 2 text, relation name) tuples
+        :return: For each item, True if "entity 1 relation entity 2" is more entailed than the reversed relation
+        """
+        premises = [premise for premise, _, _, _ in items for _ in range(2)]
+        hypotheses = [hypothesis for _, e1_text, e2_text, rel_name in items
+                      for hypothesis in (f"{e1_text} {rel_name} {e2_text}", f"{e2_text} {rel_name} {e1_text}")]
+        scores = self.entailment_scores(premises, hypotheses).reshape(-1, 2)
+        return (scores[:, 0] >= scores[:, 1]).tolist()
+
+    def negations(self, items: Sequence[Tuple[str, str, str, str]]) -> List[bool]:
+        """
+        Detect negated relations
+        :param items: List of (premise, entity 1 text, entity 2 text, relation name) tuples
+        :return: For each item, True if the negated relation is more entailed than the relation
+        """
+        premises = [premise for premise, _, _, _ in items for _ in range(2)]
+        hypotheses = [hypothesis for _, e1_text, e2_text, rel_name in items
+                      for hypothesis in (f"{e1_text} {negate(rel_name)} {e2_text}", f"{e1_text} {rel_name} {e2_text}")]
+        scores = self.entailment_scores(premises, hypotheses).reshape(-1, 2)
+        return (scores[:, 0] > scores[:, 1]).tolist()
+
+    def postprocess(self, docs: Iterator[Doc], relations_pred: List[List[RelationSpan]]) -> List[List[RelationSpan]]:
+        """
+        Fix the order of the entities of predicted relations and, if `drop_negated` is set, drop negated relations.
+        The relations of all the documents are scored together
+        :param docs: Documents of the relations
+        :param relations_pred: Relations predicted for each document
+        :return: Relations of each document, with their entities in the entailed order
+        """
+        relations = [(doc_id, relation) for doc_id, doc_relations in enumerate(relations_pred)
+                     for relation in doc_relations]
+        docs = list(docs)
+        items = [(docs[doc_id].text, docs[doc_id].text[r.start.start:r.start.end],
+                  docs[doc_id].text[r.end.start:r.end.end], r.relation.name) for doc_id, r in relations]
+        orders = self.entity_orders(items)
+        negated = self.negations(items) if self.drop_negated else [False] * len(items)
+
+        postprocessed = [[] for _ in relations_pred]
+        for (doc_id, relation), ordered, is_negated in zip(relations, orders, negated):
+            if is_negated:
+                continue
+            if not ordered:
+                relation = RelationSpan(start=relation.end, end=relation.start, relation=relation.relation,
+                                        score=relation.score, kb_id=relation.kb_id)
+            postprocessed[doc_id].append(relation)
+        return postprocessed
+
+
+def negate(rel_name):
+    if "is " in rel_name:
+        return rel_name.replace("is", "is not", 1)
+    return "does not " + rel_name
+
+
+@lru_cache(maxsize=None)
+def get_default_scorer() -> EntityOrderScorer:
+    """ Scorer used by the functions of the module, created on first use """
+    return EntityOrderScorer()
+
+
 def score(premise, e1_text, e2_text, rel_name):
-    sentence1 = "{} {} {}".format(e1_text, rel_name, e2_text)
-    sentence2 = "{} {} {}".format(e2_text, rel_name, e1_text)
-    output = classifier(premise, (sentence1, sentence2))
-    scores = output["scores"]
-    if np.argmax(scores) == output["labels"].index(sentence1):
+    if get_default_scorer().entity_orders([(premise, e1_text, e2_text, rel_name)])[0]:
         return e1_text, e2_text
     else:
         return e2_text, e1_text
 
 
 def has_negation(premise, e1_text, e2_text, rel_name):
-    if "is " in rel_name:
-        negated_rel_name = rel_name.replace("is", "is not", 1)
-    else:
-        negated_rel_name = "does not " + rel_name
-    negated = "{} {} {}".format(e1_text, negated_rel_name, e2_text)
-    positive = "{} {} {}".format(e1_text, rel_name, e2_text)
-    output = classifier(premise, (negated, positive))
-    return np.argmax(output["scores"]) == output["labels"].index(negated)
+    return get_default_scorer().negations([(premise, e1_text, e2_text, rel_name)])[0]
 
 
 def get_entity_order(e1_text, e2_text, rel_name, sentence):
@@ -35,4 +159,5 @@ def get_entity_order(e1_text, e2_text, rel_name, sentence):
 
 
 if __name__ == "__main__":
+    get_default_scorer().load_models()
     print("models downloaded")
@@ -0,0 +1,15 @@
+import pytest
+from transformers import BertTokenizerFast
+
+# Vocabulary of the tiny tokenizer used to test models without downloading them
+TINY_VOCAB = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + \
+    list("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.,()'-") + \
+    [f"##{c}" for c in "abcdefghijklmnopqrstuvwxyz"] + \
+    ["the", "of", "and", "is", "in", "an", "New", "York", "IBM", "DNS", "system", "name", "domain"]
+
+
+@pytest.fixture
+def tiny_tokenizer(tmp_path):
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(TINY_VOCAB))
+    return BertTokenizerFast(str(vocab_file), do_lower_case=False)
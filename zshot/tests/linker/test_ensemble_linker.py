@@ -1,9 +1,17 @@
+import random
+from typing import Iterator
+
+import pytest
 import spacy
+from spacy.tokens import Doc
 
-from zshot import PipelineConfig
+from zshot import Linker, PipelineConfig
 from zshot.linker.linker_ensemble import LinkerEnsemble
+from zshot.linker.linker_ensemble.utils import sub_span_scoring_per_description
+from zshot.linker.linker_regen.trie import ArrayTrie, Trie
 from zshot.tests.linker.test_linker import DummyLinkerEnd2End
-from zshot.utils.data_models import Entity
+from zshot.tests.linker.test_regen_linker import tiny_regen_linker
+from zshot.utils.data_models import Entity, Span
 
 
 def test_ensemble_linker_max():
@@ -50,3 +58,120 @@ def test_ensemble_linker_count():
     assert len(doc._.spans) > 0
     assert all([bool(ent.label_) for ent in doc.ents])
     del doc, nlp
+
+
+def test_ensemble_linker_skips_unchanged_set_kg():
+    entities = [
+        Entity(name="fruits", description="The sweet and fleshy product of a tree or other plant."),
+        Entity(name="fruits", description="Names of fruits such as banana, oranges")
+    ]
+    linker = LinkerEnsemble(linkers=[DummyLinkerEnd2End(), DummyLinkerEnd2End()])
+    linker.set_kg(entities)
+    ensembler = linker.ensembler
+    enhance_entities = linker.enhance_entities
+    linker.predict([spacy.blank("en")('Apple is a company name not a fruits like apples or orange')])
+    linker.set_kg(list(entities))
+    assert linker.ensembler is ensembler
+    assert linker.enhance_entities is enhance_entities
+    linker.set_kg(entities[:1])
+    assert linker.ensembler is not ensembler
+
+
+class DescriptionLinker(Linker):
+
+    @property
+    def is_end2end(self) -> bool:
+        return True
+
+    def predict(self, docs: Iterator[Doc], batch_size=None):
+        return [[Span(0, len(e.description), label=e.name, score=1 / len(e.description)) for e in self.entities]
+                for doc in docs]
+
+
+def test_ensemble_linker_executors():
+    entities = [
+        Entity(name="fruits", description="The sweet and fleshy product of a tree or other plant."),
+        Entity(name="fruits", description="Names of fruits such as banana, oranges"),
+        Entity(name="company", description="Companies"),
+        Entity(name="company", description="Names of companies such as IBM"),
+    ]
+    docs = [spacy.blank("en")(text) for text in ["Apple is a company name not a fruits like apples or orange",
+                                                 "IBM is a company"]]
+    predictions = []
+    for executor in [None, "thread"]:
+        linker = LinkerEnsemble(linkers=[DescriptionLinker(), DummyLinkerEnd2End()], threshold=0.2,
+                                executor=executor, max_workers=2)
+        linker.set_kg(entities)
+        predictions.append(linker.predict(docs))
+        # Each voter keeps its own set of entities, the linkers are not modified
+        assert len(linker.voters) == 4
+        assert all(len(voter.entities) == 2 for voter in linker.voters)
+        assert all(child.entities is entities for child in linker.linkers)
+    assert predictions[0] == predictions[1]
+    assert all(len(doc_spans) > 0 for doc_spans in predictions[0])
+
+
+def test_ensemble_linker_shares_read_only_state(tiny_tokenizer, tmp_path):
+    entities = [Entity(name="IBM", description="technology corporation"),
+                Entity(name="IBM", description="Names of companies such as IBM")]
+    regen = tiny_regen_linker(tiny_tokenizer)
+    ArrayTrie.from_trie(Trie([tiny_tokenizer(e.name)['input_ids'] for e in entities])).save(tmp_path)
+    fixed_trie_regen = tiny_regen_linker(tiny_tokenizer)
+    fixed_trie_regen.trie = ArrayTrie.load(tmp_path)
+    fixed_trie_regen.skip_set_kg = True
+    linker = LinkerEnsemble(linkers=[regen, fixed_trie_regen])
+    linker.set_kg(entities)
+    linker.build_voters()
+    regen_voters, fixed_trie_voters = linker.voters[::2], linker.voters[1::2]
+    assert all(voter.model is regen.model for voter in regen_voters)
+    # The trie depends on the entities of each voter, unless it was given to the linker
+    assert all(voter.trie is not regen.trie for voter in regen_voters)
+    assert all(voter.trie is fixed_trie_regen.trie for voter in fixed_trie_voters)
+
+
+def test_ensemble_linker_batch_max_tokens():
+    linker = LinkerEnsemble(linkers=[DescriptionLinker(), DummyLinkerEnd2End()])
+    linker.set_batch_max_tokens(1024)
+    assert all(child.batch_max_tokens == 1024 for child in linker.linkers)
+    linker.set_kg([Entity(name="company", description="Companies"),
+                   Entity(name="company", description="Names of companies such as IBM")])
+    linker.build_voters()
+    assert all(voter.batch_max_tokens == 1024 for voter in linker.voters)
+    linker.set_batch_max_tokens(None)
+    assert all(child.batch_max_tokens is None for child in linker.linkers + linker.voters)
+
+
+def test_ensemble_linker_wrong_executor():
+    with pytest.raises(ValueError):
+        LinkerEnsemble(linkers=[DummyLinkerEnd2End()], executor="gpu")
+    with pytest.raises(ValueError):
+        LinkerEnsemble(linkers=[DummyLinkerEnd2End()], executor="process")
+
+
+def test_sub_span_scoring_per_description():
+    random.seed(0)
+    spans = []
+    for _ in range(4):
+        voter_spans = []
+        for _ in range(100):
+            start = random.randint(0, 60)
+            voter_spans.append(Span(start=start, end=start + random.randint(1, 8), label=random.choice(['A', 'B', 'C']),
+                                    score=random.choice([0.2, 0.5, 0.8])))
+        spans.append(voter_spans)
+    union_spans = {}
+    for voter_spans in spans:
+        for s in voter_spans:
+            union_spans.setdefault((s.start, s.end), []).append(s)
+
+    expected = {k: list(v) for k, v in union_spans.items()}
+    for k in expected:
+        for voter_spans in spans:
+            labels = {}
+            for p in voter_spans:
+                if k[0] <= p.start and k[1] >= p.end and (k[0] < p.start or k[1] > p.end):
+                    if p.label not in labels or labels[p.label].score < p.score:
+                        labels[p.label] = p
+            expected[k].extend(Span(label=p.label, score=p.score, start=k[0], end=k[1]) for p in labels.values())
+
+    sub_span_scoring_per_description(union_spans, spans)
+    assert union_spans == expected
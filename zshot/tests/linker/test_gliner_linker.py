@@ -7,6 +7,7 @@ import spacy
 from zshot import PipelineConfig, Linker
 from zshot.linker import LinkerGLINER
 from zshot.tests.config import EX_DOCS, EX_ENTITIES
+from zshot.utils.data_models import Span
 
 logger = logging.getLogger(__name__)
 
@@ -57,3 +58,41 @@ def test_gliner_linker_no_entities():
     del nlp.get_pipe('zshot').linker.model, nlp.get_pipe('zshot').linker
     nlp.remove_pipe('zshot')
     del doc, nlp, gliner_config
+
+
+class BatchRecorderGLiNER:
+    def __init__(self):
+        self.calls = []
+
+    def batch_predict_entities(self, texts, labels, flat_ner=True, threshold=0.5, multi_label=False):
+        self.calls.append((texts, flat_ner, threshold, multi_label))
+        return [[{"start": 0, "end": 3, "label": labels[0], "score": threshold}] for _ in texts]
+
+
+def test_gliner_linker_batch_predict():
+    nlp = spacy.blank("en")
+    linker = LinkerGLINER(threshold=0.3, flat_ner=False, multi_label=True)
+    linker.model = BatchRecorderGLiNER()
+    linker.set_kg(EX_ENTITIES)
+    docs = [nlp(text) for text in EX_DOCS]
+    span_annotations = linker.predict(docs, batch_size=2)
+    assert len(span_annotations) == len(docs)
+    assert [texts for texts, _, _, _ in linker.model.calls] == [EX_DOCS[i:i + 2] for i in range(0, len(EX_DOCS), 2)]
+    assert all(call[1:] == (False, 0.3, True) for call in linker.model.calls)
+    assert all(spans[0].label == EX_ENTITIES[0].name for spans in span_annotations.to_spans())
+
+
+def test_gliner_linker_batch_predict_with_token_budget():
+    nlp = spacy.blank("en")
+    linker = LinkerGLINER()
+    linker.model = BatchRecorderGLiNER()
+    nlp.add_pipe("zshot", config=PipelineConfig(linker=linker, entities=EX_ENTITIES, batch_max_tokens=64),
+                 last=True)
+    docs = list(nlp.pipe(EX_DOCS, batch_size=2))
+    # Documents are predicted sorted by length, but their spans are returned in the order of the documents
+    assert [texts for texts, _, _, _ in linker.model.calls] == [[EX_DOCS[1]], [EX_DOCS[0]]]
+    assert [d._.spans for d in docs] == [[Span(0, 3, EX_ENTITIES[0].name, 0.5)] for _ in docs]
+    assert [list(d.ents) for d in docs] == \
+        [[d.char_span(0, 3, label=EX_ENTITIES[0].name, alignment_mode='expand')] for d in docs]
+    nlp.remove_pipe('zshot')
+    del docs, nlp
@@ -8,7 +8,7 @@ from spacy.tokens import Doc
 from zshot import Linker, PipelineConfig
 from zshot.tests.config import EX_DOCS, EX_ENTITIES
 from zshot.tests.mentions_extractor.test_mention_extractor import DummyMentionsExtractor
-from zshot.utils.data_models import Span
+from zshot.utils.data_models import Span, SpanBatch
 
 
 class DummyLinker(Linker):
@@ -30,6 +30,12 @@ class DummyLinkerEnd2End(Linker):
         return [[Span(0, len(doc.text) - 1, label='label', score=0.9)] for doc in docs]
 
 
+class DummyLinkerSpanBatch(DummyLinkerEnd2End):
+
+    def predict(self, docs: Iterator[Doc], batch_size=None):
+        return SpanBatch.from_spans(super().predict(docs, batch_size))
+
+
 class DummyLinkerWithEntities(Linker):
 
     def predict(self, docs: Iterator[Doc], batch_size=None):
@@ -111,3 +117,24 @@ def test_dummy_linker_end2end():
     assert len(doc.ents) > 0
     assert len(doc._.spans) > 0
     del doc, nlp
+
+
+def test_dummy_linker_span_batch():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("zshot", config=PipelineConfig(linker=DummyLinkerSpanBatch(), entities=EX_ENTITIES), last=True)
+    docs = list(nlp.pipe(EX_DOCS))
+    assert [d._.spans for d in docs] == DummyLinkerEnd2End().predict(docs)
+    assert all(len(d.ents) == 1 for d in docs)
+    del docs, nlp
+
+
+def test_linker_entities_version():
+    linker = DummyLinker()
+    assert linker.entities_version is None
+    linker.set_kg(EX_ENTITIES)
+    version = linker.entities_version
+    assert version is not None
+    linker.set_kg(list(EX_ENTITIES))
+    assert linker.entities_version == version
+    linker.set_kg(EX_ENTITIES[:-1])
+    assert linker.entities_version != version
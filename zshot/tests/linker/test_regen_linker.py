@@ -1,15 +1,19 @@
 import gc
 import logging
 
+import numpy as np
 import pytest
 import spacy
+import torch
+from transformers import BartConfig, BartForConditionalGeneration
 
 from zshot import PipelineConfig
-from zshot.linker.linker_regen.linker_regen import LinkerRegen
-from zshot.linker.linker_regen.trie import Trie
+from zshot.linker.linker_regen.linker_regen import LinkerRegen, START_ENT_TOKEN, END_ENT_TOKEN
+from zshot.linker.linker_regen.trie import ArrayTrie, Trie
 from zshot.linker.linker_regen.utils import load_wikipedia_trie, load_dbpedia_trie, create_input
 from zshot.tests.config import EX_DOCS, EX_ENTITIES
 from zshot.tests.mentions_extractor.test_mention_extractor import DummyMentionsExtractor
+from zshot.utils.data_models import Entity
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +69,48 @@ def test_regen_linker_wikification():
     del doc, nlp, config
 
 
+def test_trie_cursor():
+    trie = Trie([[794, 536, 1], [794, 357, 1], [12, 1]])
+    cursor = trie.cursor()
+    prefixes = [[2], [2, 794], [2, 794, 536], [2, 794, 357, 1], [2, 12], [2, 5], [2, 5, 1], [2, 794, 536, 1]]
+    for prefix in prefixes:
+        assert cursor.postfix(prefix) == trie.postfix(prefix)
+    assert cursor.nodes[(2, 794, 536)] is trie.trie_dict[794][536]
+    assert cursor.nodes[(2, 5)] is None
+
+
+def test_trie_remove():
+    sequences = [[794, 536, 1], [794, 357, 1], [794, 536, 7, 1], [794, 536]]
+    trie = Trie(sequences + [[794, 357, 1]])
+    trie.remove([794, 357, 1])
+    assert trie.trie_dict == Trie(sequences).trie_dict
+    trie.remove([794, 357, 1])
+    trie.remove([794, 536])
+    assert trie.trie_dict == Trie([[794, 536, 1], [794, 536, 7, 1]]).trie_dict
+    trie.remove([794, 536, 7, 1])
+    assert trie.trie_dict == Trie([[794, 536, 1]]).trie_dict
+    trie.remove([794, 536, 1])
+    assert trie.trie_dict == {}
+    with pytest.raises(ValueError):
+        trie.remove([794, 536, 1])
+
+
+def test_array_trie(tmp_path):
+    sequences = [[794, 536, 1], [794, 357, 1], [12, 1], [794, 536, 7, 1]]
+    trie = Trie(sequences)
+    array_trie = ArrayTrie.from_trie(trie)
+    array_trie.save(tmp_path)
+    for loaded_trie in [ArrayTrie.load(tmp_path), ArrayTrie.load(tmp_path, mmap=False)]:
+        cursor = loaded_trie.cursor()
+        for sequence in sequences:
+            for i in range(len(sequence) + 1):
+                prefix = [2] + sequence[:i]
+                assert sorted(loaded_trie.postfix(prefix)) == sorted(trie.postfix(prefix))
+                assert cursor.postfix(prefix) == loaded_trie.postfix(prefix)
+        assert loaded_trie.postfix([2, 5]) == [] and loaded_trie.postfix([2, 12, 1, 4]) == []
+    assert isinstance(ArrayTrie.load(tmp_path).tokens, np.memmap)
+
+
 @pytest.mark.skip(reason="Too expensive to run on every commit")
 def test_load_wikipedia_trie():  # pragma: no cover
     trie = load_wikipedia_trie()
@@ -94,3 +140,56 @@ def test_create_input():
     text = f"IBM headquarters are located in {start_delimiter} New York {end_delimiter} ."
     input_ = create_input(text, max_length=4, start_delimiter=start_delimiter, end_delimiter=end_delimiter)
     assert start_delimiter in input_ and end_delimiter in input_
+
+
+def tiny_regen_linker(tokenizer, batch_max_tokens=None):
+    tokenizer.add_tokens([START_ENT_TOKEN, END_ENT_TOKEN])
+    tokenizer.eos_token = "[SEP]"
+    tokenizer.model_input_names = ["input_ids", "attention_mask"]
+    torch.manual_seed(0)
+    config = BartConfig(vocab_size=len(tokenizer), d_model=32, encoder_layers=1, decoder_layers=1,
+                        encoder_attention_heads=2, decoder_attention_heads=2, encoder_ffn_dim=32, decoder_ffn_dim=32,
+                        pad_token_id=tokenizer.pad_token_id, eos_token_id=tokenizer.sep_token_id,
+                        decoder_start_token_id=tokenizer.sep_token_id, forced_bos_token_id=None,
+                        forced_eos_token_id=None)
+    linker = LinkerRegen(max_output_len=8, num_beams=4)
+    linker.tokenizer = tokenizer
+    linker.model = BartForConditionalGeneration(config).eval()
+    linker.set_kg(EX_ENTITIES)
+    linker.set_batch_max_tokens(batch_max_tokens)
+    return linker
+
+
+def test_regen_linker_batched_generate(tiny_tokenizer):
+    nlp = spacy.blank("en")
+    nlp.add_pipe("zshot", config=PipelineConfig(mentions_extractor=DummyMentionsExtractor()), last=True)
+    docs = list(nlp.pipe(EX_DOCS))
+    names = {e.name for e in EX_ENTITIES}
+    span_annotations = tiny_regen_linker(tiny_tokenizer).predict(docs, batch_size=1)
+    for batch_size, batch_max_tokens in [(None, None), (3, None), (None, 256)]:
+        batched_span_annotations = tiny_regen_linker(tiny_tokenizer, batch_max_tokens).predict(docs, batch_size=batch_size)
+        assert [[(s.start, s.end, s.label) for s in spans] for spans in batched_span_annotations] == \
+            [[(s.start, s.end, s.label) for s in spans] for spans in span_annotations]
+        assert [s.score for spans in batched_span_annotations for s in spans] == \
+            pytest.approx([s.score for spans in span_annotations for s in spans], abs=1e-4)
+    assert all(s.label in names for spans in span_annotations for s in spans)
+
+
+def test_regen_linker_array_trie(tiny_tokenizer):
+    nlp = spacy.blank("en")
+    nlp.add_pipe("zshot", config=PipelineConfig(mentions_extractor=DummyMentionsExtractor()), last=True)
+    docs = list(nlp.pipe(EX_DOCS))
+    linker = tiny_regen_linker(tiny_tokenizer)
+    span_annotations = linker.predict(docs)
+    linker.trie = ArrayTrie.from_trie(linker.trie)
+    assert [[(s.start, s.end, s.label) for s in spans] for spans in linker.predict(docs)] == \
+        [[(s.start, s.end, s.label) for s in spans] for spans in span_annotations]
+
+
+def test_regen_linker_incremental_set_kg(tiny_tokenizer):
+    linker = tiny_regen_linker(tiny_tokenizer)
+    tokenizer = linker.tokenizer
+    new_entity = Entity(name="New", description="")
+    for entities in [EX_ENTITIES[1:] + [new_entity], EX_ENTITIES[:2] + EX_ENTITIES[:2], EX_ENTITIES, []]:
+        linker.set_kg(entities)
+        assert linker.trie.trie_dict == Trie([tokenizer(e.name)['input_ids'] for e in entities]).trie_dict
@@ -5,8 +5,10 @@ import pytest
 import spacy
 
 from zshot import PipelineConfig, Linker
-from zshot.linker import LinkerSMXM
+from zshot.linker import LinkerSMXM, linker_smxm
 from zshot.tests.config import EX_DOCS, EX_ENTITIES
+from zshot.tests.utils.test_smxm import tiny_smxm_model
+from zshot.utils.data_models import Entity
 
 logger = logging.getLogger(__name__)
 
@@ -57,3 +59,27 @@ def test_smxm_linker_no_entities():
     del nlp.get_pipe('zshot').linker.tokenizer, nlp.get_pipe('zshot').linker.model, nlp.get_pipe('zshot').linker
     nlp.remove_pipe('zshot')
     del doc, nlp, smxm_config
+
+
+def test_smxm_linker_predict_variants_caches_descriptions(tiny_tokenizer, monkeypatch):
+    monkeypatch.setattr(linker_smxm.BertTokenizerFast, "from_pretrained", lambda *args, **kwargs: tiny_tokenizer)
+    encoded = []
+    encoded_descriptions = linker_smxm.EncodedDescriptions
+
+    def record_encoded_descriptions(descriptions, tokenizer):
+        encoded.append(descriptions)
+        return encoded_descriptions(descriptions, tokenizer)
+
+    monkeypatch.setattr(linker_smxm, "EncodedDescriptions", record_encoded_descriptions)
+    linker = LinkerSMXM()
+    linker.model = tiny_smxm_model(vocab_size=len(tiny_tokenizer))
+    nlp = spacy.blank("en")
+    docs = [nlp(text) for text in EX_DOCS]
+    variants = [EX_ENTITIES[:3], EX_ENTITIES[:2] + [Entity(name="DNS", description="name of a domain")]]
+    spans = linker.predict_variants(docs, variants)
+    assert linker.predict_variants(docs, variants) == spans
+    # The union of the descriptions is tokenized once, and again only when the entities change
+    assert len(encoded) == 1
+    assert encoded[0][1:] == [e.description for e in EX_ENTITIES[:3]] + ["name of a domain"]
+    linker.predict_variants(docs, variants[:1])
+    assert len(encoded) == 2
@@ -3,9 +3,11 @@ import pkgutil
 
 import pytest
 import spacy
+import torch
 
 from zshot import PipelineConfig, Linker
 from zshot.linker import LinkerTARS
+from zshot.linker.linker_ensemble import LinkerEnsemble
 from zshot.tests.config import EX_DOCS, EX_ENTITIES
 from zshot.utils.data_models import Entity
 
@@ -128,3 +130,36 @@ def test_flat_entities():
     linker_tars.set_kg(None)
     assert linker_tars.entities == []
     del linker_tars
+
+
+class TaskRecorderTARS(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.tasks = {}
+        self.current_task = None
+        self.predicted_tasks = []
+
+    def add_and_switch_to_new_task(self, task, labels, label_type):
+        self.tasks[task] = labels
+        self.current_task = task
+
+    def switch_to_task(self, task):
+        self.current_task = task
+
+    def predict(self, sentences, **kwargs):
+        self.predicted_tasks.append(self.tasks[self.current_task])
+
+
+def test_tars_ensemble_voters_use_their_task():
+    linker = LinkerTARS()
+    linker.model = TaskRecorderTARS()
+    ensemble = LinkerEnsemble(linkers=[linker])
+    ensemble.set_kg(EX_ENTITIES)
+    ensemble.enhance_entities = [[Entity(name="company"), Entity(name="location")], [Entity(name="fruit")]]
+    ensemble.build_voters()
+    # The voters share the model, which is left in the task of the last voter
+    assert all(voter.model is linker.model for voter in ensemble.voters)
+    docs = [spacy.blank("en")(EX_DOCS[0])]
+    for voter in ensemble.voters:
+        voter.predict(docs)
+    assert linker.model.predicted_tasks == [["company", "location"], ["fruit"]]
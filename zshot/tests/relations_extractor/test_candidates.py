@@ -0,0 +1,53 @@
+import spacy
+
+import zshot  # noqa: F401
+from zshot.relation_extractor.candidates import candidate_pairs
+from zshot.utils.data_models import Relation, Span
+
+TEXT = "Alice works for IBM. Bob lives in Paris. IBM is in Armonk."
+
+
+def make_doc(nlp, labels):
+    doc = nlp(TEXT)
+    doc._.spans = [Span(TEXT.index(text), TEXT.index(text) + len(text), label=label) for text, label in labels]
+    return doc
+
+
+def test_candidate_pairs_without_constraints():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("zshot")
+    doc = make_doc(nlp, [("Alice", "person"), ("IBM", "company"), ("Bob", "person"), ("IBM", "company")])
+    relations = [Relation(name="works for"), Relation(name="knows")]
+    pairs = candidate_pairs(doc, relations)
+    spans = doc._.spans
+    # The duplicated IBM entity is only considered once
+    assert [[(e1, e2, r) for e1, e2, r in items] for items in pairs] == [
+        [(spans[i], spans[j], 0), (spans[i], spans[j], 1)] for i, j in [(0, 1), (0, 2), (1, 2)]
+    ]
+
+
+def test_candidate_pairs_with_labels():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("zshot")
+    doc = make_doc(nlp, [("Alice", "person"), ("IBM", "company"), ("Paris", "city"), ("Armonk", "city")])
+    relations = [Relation(name="works for", subject_labels=["person"], object_labels=["company"]),
+                 Relation(name="located in", subject_labels=["company"], object_labels=["city"])]
+    pairs = candidate_pairs(doc, relations)
+    alice, ibm, paris, armonk = doc._.spans
+    assert pairs == [[(alice, ibm, 0)], [(ibm, paris, 1)], [(ibm, armonk, 1)]]
+    # Entities are reversed when the labels are only allowed in the other direction
+    doc._.spans = [paris, ibm]
+    assert candidate_pairs(doc, relations) == [[(ibm, paris, 1)]]
+
+
+def test_candidate_pairs_with_distances():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    nlp.add_pipe("zshot")
+    doc = make_doc(nlp, [("Alice", "person"), ("IBM", "company"), ("Bob", "person"), ("Armonk", "city")])
+    alice, ibm, bob, armonk = doc._.spans
+    pairs = candidate_pairs(doc, [Relation(name="near", max_char_distance=12)])
+    assert pairs == [[(alice, ibm, 0)], [(ibm, bob, 0)]]
+    pairs = candidate_pairs(doc, [Relation(name="same sentence", max_sentence_distance=0),
+                                  Relation(name="next sentence", max_sentence_distance=1)])
+    assert pairs == [[(alice, ibm, 0), (alice, ibm, 1)], [(alice, bob, 1)], [(ibm, bob, 1)], [(bob, armonk, 1)]]
@@ -0,0 +1,59 @@
+import spacy
+import torch
+from transformers import BartConfig, BartForSequenceClassification
+
+from zshot.relation_extractor.zsrc.decide_entity_order import EntityOrderScorer
+from zshot.utils.data_models import Relation, Span
+from zshot.utils.data_models.relation_span import RelationSpan
+
+ITEMS = [
+    ("IBM is in New York", "IBM", "New York", "is in"),
+    ("the domain name system of IBM", "IBM", "domain name system", "has"),
+    ("New York is in the system", "system", "New York", "is in"),
+]
+
+
+def tiny_scorer(tokenizer, batch_size=8, drop_negated=False):
+    scorer = EntityOrderScorer(device="cpu", batch_size=batch_size, drop_negated=drop_negated)
+    scorer.tokenizer = tokenizer
+    torch.manual_seed(0)
+    config = BartConfig(vocab_size=len(tokenizer), d_model=32, encoder_layers=1, decoder_layers=1,
+                        encoder_attention_heads=2, decoder_attention_heads=2, encoder_ffn_dim=32, decoder_ffn_dim=32,
+                        pad_token_id=scorer.tokenizer.pad_token_id, eos_token_id=scorer.tokenizer.sep_token_id,
+                        num_labels=3, label2id={"contradiction": 0, "neutral": 1, "entailment": 2},
+                        id2label={0: "contradiction", 1: "neutral", 2: "entailment"})
+    scorer.model = BartForSequenceClassification(config).eval()
+    return scorer
+
+
+def test_entity_order_scorer_is_lazy():
+    scorer = EntityOrderScorer()
+    assert scorer.model is None and scorer.tokenizer is None
+
+
+def test_entity_order_scorer_batches(tiny_tokenizer):
+    scorer = tiny_scorer(tiny_tokenizer, batch_size=1)
+    batched_scorer = tiny_scorer(tiny_tokenizer, batch_size=4)
+    assert batched_scorer.entity_orders(ITEMS) == scorer.entity_orders(ITEMS)
+    assert batched_scorer.negations(ITEMS) == scorer.negations(ITEMS)
+    assert batched_scorer.entity_orders([]) == []
+
+
+def test_entity_order_scorer_postprocess(tiny_tokenizer):
+    nlp = spacy.blank("en")
+    docs = [nlp(premise) for premise, _, _, _ in ITEMS]
+    relations_pred = []
+    for doc, (premise, e1_text, e2_text, rel_name) in zip(docs, ITEMS):
+        e1 = Span(premise.index(e1_text), premise.index(e1_text) + len(e1_text), label="e1")
+        e2 = Span(premise.index(e2_text), premise.index(e2_text) + len(e2_text), label="e2")
+        relations_pred.append([RelationSpan(start=e1, end=e2, relation=Relation(name=rel_name), score=0.9)])
+    scorer = tiny_scorer(tiny_tokenizer, drop_negated=True)
+    orders, negations = scorer.entity_orders(ITEMS), scorer.negations(ITEMS)
+    postprocessed = scorer.postprocess(docs, relations_pred)
+    for relations, doc_relations, ordered, negated in zip(postprocessed, relations_pred, orders, negations):
+        if negated:
+            assert relations == []
+        else:
+            relation, = relations
+            assert (relation.start, relation.end) == ((doc_relations[0].start, doc_relations[0].end) if ordered
+                                                      else (doc_relations[0].end, doc_relations[0].start))
@@ -1,12 +1,16 @@
 from typing import Iterator
 
 import spacy
+import torch
 from spacy.tokens import Doc
 
 from zshot import PipelineConfig, Linker
 from zshot.relation_extractor import RelationsExtractorZSRC
+from zshot.relation_extractor import relation_extractor_zsrc
+from zshot.relation_extractor.zsrc import data_helper
+from zshot.relation_extractor.zsrc.data_helper import ZSDataset
 from zshot.tests.config import EX_RELATIONS, EX_DATASET_RELATIONS, EX_DOCS
-from zshot.utils.data_models import Span
+from zshot.utils.data_models import Relation, Span
 
 
 class DummyLinkerEnd2End(Linker):
@@ -27,3 +31,84 @@ def test_zsrc_with_entities_config_dummy_annotator():
     assert len(doc._.relations) == 0
     doc = nlp(EX_DATASET_RELATIONS['sentences'][0])
     assert len(doc._.relations) == 1
+
+
+def test_zsdataset_encodes_each_text_once(tiny_tokenizer):
+    tokenizer = tiny_tokenizer
+    sentence = "IBM is in New York"
+    e1, e2 = Span(0, 3, label="company"), Span(10, 18, label="city")
+    descriptions = ["is in", "the domain of"]
+    data = [(e1, e2, sentence), (e2, e1, sentence)] * 2
+    dataset = ZSDataset("test", data, descriptions * 2, tokenizer=tokenizer)
+    assert list(dataset.sentence_encodings) == [sentence]
+    assert list(dataset.description_tokens) == descriptions
+    for (_, _, text), description, item in zip(data, descriptions * 2, dataset):
+        tokens_tensor, segments_tensor, marked_e1, marked_e2, _ = item
+        assert tokenizer.convert_ids_to_tokens(tokens_tensor.tolist()) == \
+            ["[CLS]"] + tokenizer.tokenize(description) + ["[SEP]"] + tokenizer.tokenize(text) + ["[SEP]"]
+        assert len(segments_tensor) == len(marked_e1) == len(marked_e2) == len(tokens_tensor)
+    assert [dataset.item_length(i) for i in range(len(dataset))] == [len(item[0]) for item in dataset]
+
+
+def test_zsdataset_context_window(tiny_tokenizer):
+    tokenizer = tiny_tokenizer
+    sentence = "IBM is in New York. " * 150
+    start = sentence.rindex("IBM")
+    e1, e2 = Span(start, start + 3, label="company"), Span(start + 10, start + 18, label="city")
+    window = (start, len(sentence))
+    dataset = ZSDataset("test", [(e1, e2, sentence), (e1, e2, sentence, window)], ["is in"] * 2,
+                        tokenizer=tokenizer)
+    (tokens_tensor, _, marked_e1, marked_e2, _), (window_tokens_tensor, *_) = dataset[0], dataset[1]
+    # The document doesn't fit in the model, so the context is cut around the entities
+    assert len(tokenizer.tokenize(sentence)) > 512
+    assert len(tokens_tensor) == 512
+    assert [dataset.item_length(0), dataset.item_length(1)] == [len(tokens_tensor), len(window_tokens_tensor)]
+    assert marked_e1.sum() > 0 and marked_e2.sum() > 0
+    assert tokenizer.convert_ids_to_tokens(window_tokens_tensor.tolist()) == \
+        ["[CLS]"] + tokenizer.tokenize("is in") + ["[SEP]"] + tokenizer.tokenize(sentence[start:]) + ["[SEP]"]
+
+
+def test_zsrc_sentences_window():
+    sentences = [(0, 20), (20, 40), (40, 60)]
+    e1, e2 = Span(25, 30, label="company"), Span(45, 50, label="city")
+    assert RelationsExtractorZSRC._sentences_window(sentences, e1, e2) == (20, 60)
+    assert RelationsExtractorZSRC._sentences_window(sentences, e1, e1) == (20, 40)
+
+
+class BatchRecorderZSRCModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+        self.built_items = []
+        self.num_built_items = 0
+
+    def forward(self, input_ids, token_type_ids, e1_mask, e2_mask, attention_mask, labels):
+        self.batch_sizes.append(input_ids.size(0))
+        self.built_items.append(self.num_built_items)
+        return None, torch.full((input_ids.size(0), 2), 0.5)
+
+
+def test_zsrc_batches_items_with_its_batch_size(tiny_tokenizer, monkeypatch):
+    model = BatchRecorderZSRCModel()
+    monkeypatch.setattr(relation_extractor_zsrc, "load_model", lambda device: model)
+    monkeypatch.setattr(data_helper, "get_tokenizer", lambda: tiny_tokenizer)
+    get_item = data_helper.ZSDataset.__getitem__
+
+    def record_get_item(dataset, idx):
+        model.num_built_items += 1
+        return get_item(dataset, idx)
+
+    monkeypatch.setattr(data_helper.ZSDataset, "__getitem__", record_get_item)
+    nlp = spacy.blank("en")
+    nlp.add_pipe("zshot", config=PipelineConfig(), last=True)
+    docs = [nlp("IBM is in New York and the DNS"), nlp("the domain name of IBM")]
+    for doc in docs:
+        doc._.spans = [Span(t.idx, t.idx + len(t), label="X") for t in doc if t.is_alpha][:4]
+    extractor = RelationsExtractorZSRC(batch_size=4)
+    extractor.set_relations([Relation(name="in", description="is in"), Relation(name="of", description="of")])
+    # The batch size of predict is a number of documents (e.g. 1000 in nlp.pipe), not of items
+    extractor.predict(docs, batch_size=1000)
+    assert sum(model.batch_sizes) == (6 + 6) * 2
+    assert max(model.batch_sizes) == 4
+    # The items of each batch are built when the batch is loaded, not all before the first forward pass
+    assert model.built_items[0] == model.batch_sizes[0]
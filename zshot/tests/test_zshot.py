@@ -126,3 +126,50 @@ def test_process_pipeline_documents():
     nlp.add_pipe("zshot", last=True)
     assert "zshot" in nlp.pipe_names
     assert all(doc._.mentions is not None for doc in nlp.pipe(EX_DOCS))
+
+
+def test_pipe_streams_batches_in_order():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("zshot", config=PipelineConfig(
+        mentions_extractor=DummyMentionsExtractor(),
+        linker=DummyLinker()), last=True)
+    zshot_component: Zshot = nlp.get_pipe("zshot")
+    texts = [f"Document {i} mentions IBM." for i in range(5)]
+    consumed = []
+
+    def stream():
+        for text in texts:
+            consumed.append(text)
+            yield nlp.make_doc(text)
+
+    docs = zshot_component.pipe(stream(), batch_size=2)
+    first = next(docs)
+    assert first.text == texts[0]
+    assert len(consumed) == 2
+    assert len(first._.mentions) > 0
+    rest = list(docs)
+    assert [doc.text for doc in [first] + rest] == texts
+    assert all(len(doc._.spans) > 0 for doc in rest)
+
+
+def test_batch_max_tokens_configuration():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("zshot", config=PipelineConfig(
+        mentions_extractor=DummyMentionsExtractor(),
+        linker=DummyLinker(),
+        batch_max_tokens=1024), last=True)
+    zshot_component: Zshot = nlp.get_pipe("zshot")
+    assert zshot_component.mentions_extractor.batch_max_tokens == 1024
+    assert zshot_component.linker.batch_max_tokens == 1024
+    budgets = []
+    predict = zshot_component.linker.predict
+    zshot_component.linker.predict = lambda docs, batch_size=None: \
+        budgets.append(zshot_component.linker.batch_max_tokens) or predict(docs, batch_size)
+    docs = list(nlp.pipe(EX_DOCS, component_cfg={"zshot": {"batch_max_tokens": 2048}}))
+    assert len(docs) == len(EX_DOCS)
+    assert budgets and set(budgets) == {2048}
+    # The budget of pipe only applies to that call
+    assert zshot_component.mentions_extractor.batch_max_tokens == 1024
+    assert zshot_component.linker.batch_max_tokens == 1024
+    nlp(EX_DOCS[0])
+    assert budgets[-1] == 1024
@@ -0,0 +1,33 @@
+from zshot.utils.batching import make_batches, restore_order, token_budget_batches
+
+
+def test_token_budget_batches():
+    lengths = [5, 2, 9, 3, 2, 7]
+    batches = token_budget_batches(lengths, max_tokens=10)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    assert all(len(batch) * max(lengths[i] for i in batch) <= 10 for batch in batches)
+    assert batches == [[1, 4, 3], [0], [5], [2]]
+
+
+def test_token_budget_batches_with_batch_size():
+    batches = token_budget_batches([1] * 5, max_tokens=100, batch_size=2)
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+def test_token_budget_batches_longer_than_budget():
+    assert token_budget_batches([20, 1], max_tokens=10) == [[1], [0]]
+
+
+def test_restore_order():
+    lengths = [5, 2, 9, 3, 2, 7]
+    batches = token_budget_batches(lengths, max_tokens=10)
+    results = [lengths[i] for batch in batches for i in batch]
+    assert restore_order(batches, results) == lengths
+
+
+def test_make_batches():
+    lengths = [5, 2, 9, 3, 2, 7]
+    assert make_batches(lengths, batch_size=4) == [[0, 1, 2, 3], [4, 5]]
+    assert make_batches(lengths) == [list(range(len(lengths)))]
+    assert make_batches(lengths, max_tokens=10) == token_budget_batches(lengths, max_tokens=10)
+    assert make_batches([]) == []
@@ -1,8 +1,9 @@
+import numpy as np
 import pytest
 import spacy
 
 from zshot.tests.config import EX_DATASET_RELATIONS
-from zshot.utils.data_models import Entity, Relation, Span
+from zshot.utils.data_models import Entity, Relation, Span, SpanBatch
 from zshot.utils.data_models.relation_span import RelationSpan
 
 
@@ -24,7 +25,8 @@ def test_span():
     assert s.label == 'Q5034838'
 
     # Check hash
-    assert hash(s) == 10737688
+    assert hash(s) == hash(Span(start=165, end=187, label='Q5034838'))
+    assert hash(s) != hash(Span(start=165, end=187, label='Q5034838', score=1))
 
     # Check repr
     assert repr(s) == f"{s.label}, {s.start}, {s.end}, {s.score}"
@@ -90,7 +92,29 @@ def test_entity():
 
     # Check hash
     e = Entity(name='E')
-    assert hash(e) == 3095248369
+    assert hash(e) == 4081495072
+    assert hash(e) == hash(Entity(name='E'))
+
+    # Hash follows the fields
+    e.vocabulary = ['Vocab']
+    assert hash(e) != 4081495072
+    e.vocabulary.append('Vocab 2')
+    assert hash(e) == hash(Entity(name='E', vocabulary=['Vocab', 'Vocab 2']))
+    assert e == Entity(name='E', vocabulary=['Vocab', 'Vocab 2'])
+    assert e != Entity(name='E', vocabulary=['Vocab'])
+    assert len({e, Entity(name='E', vocabulary=['Vocab', 'Vocab 2']), Entity(name='E')}) == 2
+
+
+def test_entity_subclass_fields():
+    class ScopedEntity(Entity):
+        scope: str
+
+    e = ScopedEntity(name='E', scope='A')
+    assert e == ScopedEntity(name='E', scope='A')
+    assert hash(e) == hash(ScopedEntity(name='E', scope='A'))
+    assert e != ScopedEntity(name='E', scope='B')
+    assert hash(e) != hash(ScopedEntity(name='E', scope='B'))
+    assert e != Entity(name='E')
 
 
 def test_relation_span():
@@ -113,7 +137,8 @@ def test_relation_span():
     assert type(rs.relation) is Relation
 
     # Check hash
-    assert hash(rs) == 1864423560
+    assert hash(rs) == hash(RelationSpan(start=s1, end=s2, relation=Relation(name=EX_DATASET_RELATIONS['labels'][0]),
+                                         score=1))
 
     # Check repr
     assert repr(rs) == f"{rs.relation.name}, {rs.start}, {rs.end}, {rs.score}"
@@ -136,4 +161,59 @@ def test_relation():
     assert r.name == 'R'
 
     # Check hash
-    assert hash(r) == 3502422000
+    assert hash(r) == 3498950099
+    assert hash(r) != hash(Relation(name='R', max_char_distance=10))
+
+
+def test_span_slots():
+    s = Span(start=0, end=10, label='E')
+    assert not hasattr(s, '__dict__')
+    with pytest.raises(AttributeError):
+        s.text = 'text'
+
+
+def test_span_batch():
+    spans = [
+        [Span(0, 3, label='company', score=0.9, kb_id='Q37156'), Span(33, 41, label='location', score=0.5)],
+        [],
+        [Span(5, 8, label='company'), Span(10, 12)],
+    ]
+    batch = SpanBatch.from_spans(spans)
+    assert len(batch) == 4
+    assert batch.num_docs == 3
+    assert batch.labels == ['company', 'location']
+    assert batch.doc_idx.tolist() == [0, 0, 2, 2]
+    assert batch.label_id.tolist() == [0, 1, 0, -1]
+    assert batch.label_array.tolist() == ['company', 'location', 'company', None]
+    assert np.isnan(batch.score[2:]).all()
+
+    round_trip = batch.to_spans()
+    assert round_trip == spans
+    assert [[s.kb_id for s in doc_spans] for doc_spans in round_trip] == [['Q37156', None], [], [None, None]]
+    assert [[s.score for s in doc_spans] for doc_spans in round_trip] == [[0.9, 0.5], [], [None, None]]
+    assert SpanBatch.from_spans([[], []]).to_spans() == [[], []]
+
+    # From/To SpaCy Spans
+    nlp = spacy.blank('en')
+    docs = [nlp("IBM headquarters are located in  New York."), nlp("Empty"), nlp("The IBM company")]
+    spacy_spans = batch.to_spacy_spans(docs)
+    assert [[(s.text, s.label_) for s in doc_spans] for doc_spans in spacy_spans] == \
+        [[('IBM', 'company'), ('New York', 'location')], [], [('IBM', 'company'), ('company', '')]]
+    spacy_batch = SpanBatch.from_spacy_spans(spacy_spans[:2], scores=[[0.9, 0.5], []])
+    assert spacy_batch.to_spans() == spans[:2]
+    assert [[s.kb_id for s in doc_spans] for doc_spans in spacy_batch.to_spans()] == [['Q37156', None], []]
+    assert [[s.kb_id_ for s in doc_spans] for doc_spans in spacy_batch.to_spacy_spans(docs[:2])] == [['Q37156', ''], []]
+    assert SpanBatch.from_spacy_spans([spacy_spans[2]]).kb_ids is None
+
+
+def test_span_batch_unsorted_docs():
+    # Spans predicted in batches of documents sorted by length
+    batch = SpanBatch([2, 0, 2, 0], [5, 0, 10, 33], [8, 3, 12, 41], [0, 0, -1, 1], [1.0, 0.9, 0.5, 0.5],
+                      ['company', 'location'], num_docs=3)
+    assert [indices.tolist() for indices in batch.doc_indices()] == [[1, 3], [], [0, 2]]
+    assert batch.to_spans() == [[Span(0, 3, 'company', 0.9), Span(33, 41, 'location', 0.5)], [],
+                                [Span(5, 8, 'company', 1.0), Span(10, 12, None, 0.5)]]
+    nlp = spacy.blank('en')
+    docs = [nlp("IBM headquarters are located in  New York."), nlp("Empty"), nlp("The IBM company")]
+    assert batch.to_spacy_spans(docs) == [[s.to_spacy_span(doc) for s in doc_spans]
+                                          for doc, doc_spans in zip(docs, batch.to_spans())]
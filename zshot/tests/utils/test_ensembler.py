@@ -1,3 +1,5 @@
+import random
+
 from zshot.utils.data_models import Span
 from zshot.utils.ensembler import Ensembler
 
@@ -68,3 +70,17 @@ def test_inclusive():
     assert ensembler.inclusive(spans) == [
         Span(start=40, end=42, label='NEG', score=0.6)
     ]
+
+
+def test_inclusive_matches_pairwise_check():
+    random.seed(0)
+    spans = []
+    for _ in range(300):
+        start = random.randint(0, 100)
+        spans.append(Span(start=start, end=start + random.randint(0, 10), label=random.choice(['A', 'B']),
+                          score=random.random()))
+    expected = [s for s in spans
+                if not any(s.start >= o.start and s.end <= o.end and (s.start > o.start or s.end < o.end)
+                           for o in spans)]
+    assert Ensembler.inclusive(spans) == expected
+    assert Ensembler.inclusive([]) == []
@@ -0,0 +1,15 @@
+from zshot.tests.linker.test_gliner_linker import BatchRecorderGLiNER
+from zshot.utils.data_models import Span
+from zshot.utils.models.gliner.utils import gliner_predict
+
+
+def test_gliner_predict():
+    model = BatchRecorderGLiNER()
+    sentences = ["IBM is a company", "Apple", "The DNS"]
+    # Sentences predicted out of order, e.g. sorted by length, and a repeated label
+    span_batch = gliner_predict(model, sentences, ["company", "fruit", "company"], [[1, 2], [0]],
+                                flat_ner=False, threshold=0.3, multi_label=True)
+    assert [texts for texts, _, _, _ in model.calls] == [["Apple", "The DNS"], ["IBM is a company"]]
+    assert all(call[1:] == (False, 0.3, True) for call in model.calls)
+    assert span_batch.labels == ["company", "fruit"]
+    assert span_batch.to_spans() == [[Span(0, 3, "company", 0.3)] for _ in sentences]
@@ -0,0 +1,182 @@
+import numpy as np
+import pytest
+import torch
+from transformers import BertConfig
+
+from zshot.tests.config import EX_DOCS, EX_ENTITIES
+from zshot.utils.data_models import SpanBatch
+from zshot.utils.models.smxm.data import EncodedDescriptions, encode_data, tagger_multiclass_collator
+from zshot.utils.models.smxm.model import BertTaggerMultiClass
+from zshot.utils.models.smxm.utils import predictions_to_span_annotations, smxm_predict, smxm_predict_variants
+
+
+@pytest.fixture
+def tiny_tokenizer(tiny_tokenizer):
+    # SMXM truncates the sentences on the left
+    tiny_tokenizer.truncation_side = "left"
+    return tiny_tokenizer
+
+
+def tiny_smxm_model(vocab_size=100):
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=vocab_size, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=64, finetuning_task={"dropout_prob": 0.1})
+    return BertTaggerMultiClass(config).eval()
+
+
+def tiny_smxm_inputs(num_descriptions=4, lengths=(15, 20, 12), sep_index=(7, 10, 5)):
+    batch_size, seq_len = len(lengths), max(lengths)
+    input_ids = torch.randint(1, 100, (num_descriptions, batch_size, seq_len))
+    attention_mask = torch.ones_like(input_ids)
+    token_type_ids = torch.zeros_like(input_ids)
+    for i, (length, sep) in enumerate(zip(lengths, sep_index)):
+        input_ids[:, i, length:] = 0
+        attention_mask[:, i, length:] = 0
+        token_type_ids[:, i, sep:length] = 1
+    return {
+        "input_ids": input_ids,
+        "attention_mask": attention_mask,
+        "token_type_ids": token_type_ids,
+        "sep_index": torch.tensor(sep_index),
+        "seq_mask": None,
+        "split": torch.tensor(2),
+    }
+
+
+def test_smxm_model_forward():
+    model = tiny_smxm_model()
+    inputs = tiny_smxm_inputs()
+    with torch.no_grad():
+        logits = model(**inputs)
+        chunked_logits = model(**inputs, chunk_size=2)
+    assert logits.shape == (3, 10, 4)
+    assert torch.allclose(logits, chunked_logits, atol=1e-6)
+
+
+def test_smxm_model_forward_default_chunk_size():
+    model = tiny_smxm_model()
+    inputs = tiny_smxm_inputs()
+    forward_sizes = []
+    model.bert.register_forward_pre_hook(lambda module, args, kwargs: forward_sizes.append(kwargs["input_ids"].size(0)),
+                                         with_kwargs=True)
+    with torch.no_grad():
+        model(**inputs)
+    # As many pairs as sentences in each forward
+    assert forward_sizes == [3, 3, 3, 3]
+
+
+def test_smxm_model_forward_matches_per_description_pass():
+    model = tiny_smxm_model()
+    inputs = tiny_smxm_inputs()
+    sep_index_max = max(inputs["sep_index"]).item()
+    with torch.no_grad():
+        logits = model(**inputs)
+        for j in range(1, inputs["input_ids"].size(0)):
+            words_out = model.bert(input_ids=inputs["input_ids"][j],
+                                   attention_mask=inputs["attention_mask"][j],
+                                   token_type_ids=inputs["token_type_ids"][j])[0][:, :sep_index_max]
+            assert torch.allclose(logits[:, :, j], model.linear(words_out).squeeze(2), atol=1e-6)
+
+
+def test_encoded_descriptions(tiny_tokenizer):
+    descriptions = ["not an entity"] + [e.description for e in EX_ENTITIES]
+    encoded_descriptions = EncodedDescriptions(descriptions, tiny_tokenizer)
+    assert len(encoded_descriptions.descriptions_ids) == len(descriptions)
+    assert encoded_descriptions.max_descriptions_tokens == \
+        max(len(tiny_tokenizer.tokenize(d)) for d in descriptions)
+    assert encoded_descriptions.max_sentence_tokens == 512 - encoded_descriptions.max_descriptions_tokens - 3
+
+
+def test_encode_data(tiny_tokenizer):
+    labels = ["NEG"] + [e.name for e in EX_ENTITIES]
+    descriptions = ["not an entity"] + [e.description for e in EX_ENTITIES]
+    encoded_data, max_sentence_tokens = encode_data(EX_DOCS, labels, descriptions, tiny_tokenizer)
+    cached_data, _ = encode_data(EX_DOCS, labels, descriptions, tiny_tokenizer,
+                                 EncodedDescriptions(descriptions, tiny_tokenizer))
+    assert [{k: v for k, v in d.items() if k != "encoding"} for d in encoded_data] == \
+        [{k: v for k, v in d.items() if k != "encoding"} for d in cached_data]
+    for sentence, encoded_sentence in zip(EX_DOCS, encoded_data):
+        assert len(encoded_sentence["input_ids"]) == len(descriptions)
+        tokens = tiny_tokenizer.tokenize(sentence, truncation=True, max_length=max_sentence_tokens)
+        assert encoded_sentence["sep_index"] == len(tokens) + 1
+        assert encoded_sentence["encoding"].tokens == tokens
+        for description, text, input_ids, segment_ids in zip(descriptions, encoded_sentence["text"],
+                                                             encoded_sentence["input_ids"],
+                                                             encoded_sentence["segment_ids"]):
+            assert text == ["[CLS]"] + tokens + ["[SEP]"] + tiny_tokenizer.tokenize(description) + ["[SEP]"]
+            assert input_ids == tiny_tokenizer.convert_tokens_to_ids(text)
+            assert segment_ids == [0] * (len(tokens) + 1) + [1] * (len(text) - len(tokens) - 1)
+
+
+def test_predictions_to_span_annotations(tiny_tokenizer):
+    sentences = ["IBM is in New York", "IBM  is in\tNew   York", "Armonk is in New York"]
+    labels = ["NEG", "company", "city"]
+    encoded_data, _ = encode_data(sentences, labels, ["not an entity", "a company", "a city"], tiny_tokenizer)
+    encodings = [d["encoding"] for d in encoded_data]
+    predictions = [
+        [0, 1, 0, 0, 2, 2],
+        [0, 1, 0, 0, 2, 2],
+        # Armonk is split into several tokens, only the first one is used
+        [0, 1, 0, 2, 0, 0, 0, 0, 0, 2, 2],
+    ]
+    predictions = [np.array(p) for p in predictions]
+    probabilities = [np.full(len(p), 0.8, dtype=np.float32) for p in predictions]
+    span_batch = predictions_to_span_annotations(encodings, predictions, probabilities, labels)
+    assert type(span_batch) is SpanBatch and span_batch.num_docs == len(sentences)
+    spans = span_batch.to_spans()
+    assert [[(sentences[i][s.start:s.end], s.label) for s in doc_spans] for i, doc_spans in enumerate(spans)] == [
+        [("IBM", "company"), ("New York", "city")],
+        [("IBM", "company"), ("New   York", "city")],
+        [("Armonk", "company"), ("New York", "city")],
+    ]
+    assert all(type(s.score) is float and s.score == pytest.approx(0.8) for doc_spans in spans for s in doc_spans)
+
+
+def test_tagger_multiclass_collator():
+    data = [
+        {"input_ids": [[2, 5, 3, 7, 3], [2, 5, 3, 8, 9, 3]], "input_masks": [[1] * 5, [1] * 6],
+         "segment_ids": [[0, 0, 1, 1, 1], [0, 0, 1, 1, 1, 1]], "sep_index": 2},
+        {"input_ids": [[2, 5, 6, 3, 7, 3], [2, 5, 6, 3, 8, 9, 3]], "input_masks": [[1] * 6, [1] * 7],
+         "segment_ids": [[0, 0, 0, 1, 1, 1], [0, 0, 0, 1, 1, 1, 1]], "sep_index": 3},
+    ]
+    input_ids, input_masks, segment_ids, sep_index, seq_mask, split = tagger_multiclass_collator(data)
+    assert input_ids.shape == input_masks.shape == segment_ids.shape == (2, 2, 7)
+    assert input_ids.dtype == torch.int64
+    assert input_ids[1, 0].tolist() == [2, 5, 3, 8, 9, 3, 0]
+    assert input_masks[0, 1].tolist() == [1, 1, 1, 1, 1, 1, 0]
+    assert segment_ids[0, 0].tolist() == [0, 0, 1, 1, 1, 0, 0]
+    assert sep_index.tolist() == [2, 3]
+    assert seq_mask.tolist() == [[1, 1, 0], [1, 1, 1]]
+    assert split.item() == 2
+
+
+def test_smxm_predict_with_token_budget(tiny_tokenizer):
+    model = tiny_smxm_model(vocab_size=len(tiny_tokenizer))
+    labels = ["NEG"] + [e.name for e in EX_ENTITIES]
+    descriptions = ["not an entity"] + [e.description for e in EX_ENTITIES]
+    spans = smxm_predict(model, tiny_tokenizer, EX_DOCS, labels, descriptions, batch_size=2).to_spans()
+    budget_spans = smxm_predict(model, tiny_tokenizer, EX_DOCS, labels, descriptions, batch_size=2,
+                                max_tokens=4096).to_spans()
+    assert [[(s.start, s.end, s.label) for s in doc_spans] for doc_spans in spans] == \
+        [[(s.start, s.end, s.label) for s in doc_spans] for doc_spans in budget_spans]
+    assert [s.score for doc_spans in spans for s in doc_spans] == \
+        pytest.approx([s.score for doc_spans in budget_spans for s in doc_spans], abs=1e-5)
+
+
+def test_smxm_predict_variants(tiny_tokenizer):
+    model = tiny_smxm_model(vocab_size=len(tiny_tokenizer))
+    labels = ["NEG"] + [e.name for e in EX_ENTITIES]
+    descriptions = ["not an entity"] + [e.description for e in EX_ENTITIES]
+    variants = [(labels, descriptions),
+                (labels[:3], descriptions[:2] + ["name of a domain"]),
+                (labels[:1] + labels[4:], descriptions[:1] + descriptions[4:])]
+    variants_spans = smxm_predict_variants(model, tiny_tokenizer, EX_DOCS, variants, batch_size=2)
+    assert len(variants_spans) == len(variants)
+    for (variant_labels, variant_descriptions), span_batch in zip(variants, variants_spans):
+        spans = span_batch.to_spans()
+        expected_spans = smxm_predict(model, tiny_tokenizer, EX_DOCS, variant_labels, variant_descriptions,
+                                      batch_size=2).to_spans()
+        assert [[(s.start, s.end, s.label) for s in doc_spans] for doc_spans in spans] == \
+            [[(s.start, s.end, s.label) for s in doc_spans] for doc_spans in expected_spans]
+        assert [s.score for doc_spans in spans for s in doc_spans] == \
+            pytest.approx([s.score for doc_spans in expected_spans for s in doc_spans], abs=1e-5)
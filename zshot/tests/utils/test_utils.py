@@ -1,3 +1,5 @@
+import random
+
 import spacy
 
 from zshot import PipelineConfig
@@ -5,8 +7,9 @@ from zshot.tests.config import EX_ENTITIES, EX_DOCS
 from zshot.tests.linker.test_linker import DummyLinkerEnd2End
 from zshot.tests.mentions_extractor.test_mention_extractor import DummyMentionsExtractor
 from zshot.utils import download_file
-from zshot.utils.alignment_utils import align_spans, AlignmentMode, filter_overlapping_spans
-from zshot.utils.data_models import Span
+from zshot.utils.alignment_utils import align_spans, AlignmentMode, filter_overlapping_span_batch, \
+    filter_overlapping_spans, spacy_token_offsets
+from zshot.utils.data_models import Span, SpanBatch
 from zshot.utils.displacy.displacy import ents_colors
 
 
@@ -188,3 +191,83 @@ def test_alignment_expand_overlaps_no_score():
     assert filtered_spans[0].label == "A"
     assert filtered_spans[1].start == 3 and filtered_spans[1].end == 8
     assert filtered_spans[1].label == "C"
+
+
+def test_alignment_matches_pairwise_check():
+    random.seed(0)
+    tokens_offsets = [(i * 3, i * 3 + random.randint(0, 4)) for i in range(200)]
+    random.shuffle(tokens_offsets)
+    tokens = ["t"] * len(tokens_offsets)
+    spans = []
+    for _ in range(100):
+        start = random.randint(0, 600)
+        spans.append(Span(start=start, end=start + random.randint(-1, 30), label="A", score=random.random()))
+
+    for mode in (AlignmentMode.expand, AlignmentMode.contract):
+        expected = [[ids for ids, s in enumerate(spans)
+                     if (mode == AlignmentMode.expand and (t_start <= s.start < t_end or t_start < s.end <= t_end
+                                                           or (s.start <= t_start and s.end >= t_end)))
+                     or (mode == AlignmentMode.contract and t_start >= s.start and t_end <= s.end)]
+                    for t_start, t_end in tokens_offsets]
+        assert align_spans(spans, tokens, tokens_offsets=tokens_offsets, alignment_mode=mode) == expected
+
+
+def test_spacy_token_offsets():
+    nlp = spacy.blank("en")
+    doc = nlp("IBM headquarters are located in  New York.")
+    tokens_offsets = spacy_token_offsets(doc)
+    assert tokens_offsets.tolist() == [[t.idx, t.idx + len(t.text)] for t in doc]
+    assert spacy_token_offsets(doc) is tokens_offsets
+    assert spacy_token_offsets(doc, as_list=True) == tokens_offsets.tolist()
+    assert spacy_token_offsets(doc, as_list=True) is spacy_token_offsets(doc, as_list=True)
+
+    spans = [Span(0, 3, "company", 0.8), Span(33, 41, "location", 0.9)]
+    assert filter_overlapping_spans(spans, doc, tokens_offsets=tokens_offsets, return_dict=True)['bio'] == \
+        filter_overlapping_spans(spans, list(doc), tokens_offsets=[(t.idx, t.idx + len(t.text)) for t in doc],
+                                 return_dict=True)['bio']
+
+    with doc.retokenize() as retokenizer:
+        retokenizer.merge(doc[6:8])
+    assert spacy_token_offsets(doc).tolist() == [[t.idx, t.idx + len(t.text)] for t in doc]
+
+    # Retokenization that keeps the number of tokens
+    num_tokens = len(spacy_token_offsets(doc, as_list=True))
+    with doc.retokenize() as retokenizer:
+        retokenizer.merge(doc[0:2])
+    with doc.retokenize() as retokenizer:
+        retokenizer.split(doc[2], ["locat", "ed"], heads=[(doc[2], 1), doc[3]])
+    assert len(doc) == num_tokens
+    assert spacy_token_offsets(doc).tolist() == [[t.idx, t.idx + len(t.text)] for t in doc]
+    assert spacy_token_offsets(doc, as_list=True) == [[t.idx, t.idx + len(t.text)] for t in doc]
+
+
+def test_filter_overlapping_span_batch():
+    nlp = spacy.blank("en")
+    docs = [nlp(text) for text in EX_DOCS] + [nlp("")]
+    random.seed(0)
+    spans = []
+    for doc in docs:
+        doc_spans = []
+        for _ in range(random.randint(0, 20)):
+            start = random.randint(0, len(doc.text))
+            doc_spans.append(Span(start=start, end=min(start + random.randint(1, 30), len(doc.text)),
+                                  label=random.choice(["A", "B", None]), kb_id=random.choice(["Q1", None]),
+                                  score=random.choice([random.random(), None])))
+        spans.append(doc_spans)
+    # Spans of different documents interleaved, as predicted in batches sorted by length
+    span_batch = SpanBatch.from_spans(spans)
+    order = list(range(len(span_batch)))
+    random.shuffle(order)
+    shuffled_batch = SpanBatch(span_batch.doc_idx[order], span_batch.start[order], span_batch.end[order],
+                               span_batch.label_id[order], span_batch.score[order], span_batch.labels,
+                               kb_ids=[span_batch.kb_ids[i] for i in order], num_docs=span_batch.num_docs)
+    assert shuffled_batch.to_spans() != spans
+
+    for mode in (AlignmentMode.expand, AlignmentMode.contract):
+        expected = [filter_overlapping_spans(shuffled_doc_spans, doc, tokens_offsets=spacy_token_offsets(doc),
+                                             alignment_mode=mode)
+                    for doc, shuffled_doc_spans in zip(docs, shuffled_batch.to_spans())]
+        filtered = filter_overlapping_span_batch(shuffled_batch, docs, alignment_mode=mode).to_spans()
+        assert filtered == expected
+        assert [[(s.kb_id, s.score) for s in doc_spans] for doc_spans in filtered] == \
+            [[(s.kb_id, s.score) for s in doc_spans] for doc_spans in expected]
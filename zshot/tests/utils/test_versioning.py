@@ -0,0 +1,36 @@
+import pickle
+
+from zshot.tests.config import EX_ENTITIES
+from zshot.utils.data_models import Entity
+from zshot.utils.versioning import kg_version
+
+
+class CollidingName(str):
+    def __hash__(self):
+        return 0
+
+
+def test_kg_version():
+    assert kg_version(None) is None
+    version = kg_version(EX_ENTITIES)
+    assert version == kg_version(list(EX_ENTITIES))
+    assert version == kg_version([Entity(name=e.name, description=e.description, vocabulary=e.vocabulary)
+                                  for e in EX_ENTITIES])
+    assert hash(version) == hash(kg_version(list(EX_ENTITIES)))
+    assert version != kg_version(EX_ENTITIES[:-1])
+    assert version != kg_version(EX_ENTITIES[::-1])
+    assert pickle.loads(pickle.dumps(version)) == version
+
+
+def test_kg_version_hash_collision():
+    a, b = kg_version([CollidingName("a")]), kg_version([CollidingName("b")])
+    assert hash(a) == hash(b)
+    assert a != b
+
+
+def test_kg_version_keeps_items():
+    # Later changes of the list don't change the version
+    entities = list(EX_ENTITIES)
+    version = kg_version(entities)
+    entities.append(Entity(name="fruit"))
+    assert version != kg_version(entities)
@@ -1,11 +1,13 @@
+import heapq
 from enum import Enum
 from itertools import accumulate
-from operator import attrgetter
-from typing import List, Union, Dict, Tuple, Optional
+from typing import Any, List, Union, Dict, Tuple, Optional
 
+import numpy as np
+from spacy.attrs import IDX, LENGTH
 from spacy.tokens import Doc
 
-from zshot.utils.data_models import Span
+from zshot.utils.data_models import Span, SpanBatch
 
 
 class AlignmentMode(str, Enum):
@@ -13,18 +15,89 @@ class AlignmentMode(str, Enum):
     contract = 'contract'
 
 
-def spacy_token_offsets(doc: Doc) -> List[Tuple[int, int]]:
-    return [(t.idx, t.idx + len(t.text)) for t in doc]
+TokensOffsets = Union[List[Tuple[int, int]], np.ndarray]
 
 
-def align_spans(spans: List[Span], tokens: List[str], tokens_offsets: List[Tuple[int, int]] = None,
+def spacy_token_offsets(doc: Doc, as_list: bool = False) -> TokensOffsets:
+    """
+    Get the char offsets of the tokens of a spacy Document. They are computed once per Document
+    and cached in the `token_offsets` extension, so all the components of the pipeline share them
+    :param doc: The spacy Document
+    :param as_list: If true, return the offsets as a list of [start, end] lists, also cached. The alignment
+    functions iterate the offsets in Python, so they are faster with the list
+    :return: int32 array of shape [len(doc), 2] with the start and end of each token, or its list form
+    """
+    if not Doc.has_extension("token_offsets"):
+        Doc.set_extension("token_offsets", default=None)
+    cached = doc._.token_offsets
+    # The Document may have been retokenized since the offsets were cached, even keeping the number of tokens.
+    # The text doesn't change, so the tokens are the same if they start at the same chars
+    if cached is None or not np.array_equal(cached[0][:, 0], doc.to_array(IDX)):
+        idx_length = doc.to_array([IDX, LENGTH]).astype(np.int32).reshape(-1, 2)
+        cached = [np.stack([idx_length[:, 0], idx_length[:, 0] + idx_length[:, 1]], axis=1), None]
+        doc._.token_offsets = cached
+    if not as_list:
+        return cached[0]
+    if cached[1] is None:
+        cached[1] = cached[0].tolist()
+    return cached[1]
+
+
+def _align_bounds(spans_starts: List[int], spans_ends: List[int], tokens_offsets: List[Tuple[int, int]],
+                  num_tokens: int, alignment_mode: AlignmentMode) -> List[List[int]]:
+    """
+    Align spans, given by their char bounds, to the tokens
+    :param spans_starts: Start char idx of each span
+    :param spans_ends: End char idx of each span
+    :param tokens_offsets: Tokens offsets
+    :param num_tokens: Number of tokens
+    :param alignment_mode: "contract" or "expand", see `align_spans`
+    :return: Indexes of the matching spans of each token
+    """
+    alignments = [[] for _ in range(num_tokens)]
+
+    # A token and a span can only match if their position intervals intersect. Tokens are swept by start,
+    # while the spans whose interval may intersect the token are kept in an active set
+    spans_bounds = [(min(start, end), max(start, end)) for start, end in zip(spans_starts, spans_ends)]
+    spans_order = sorted(range(len(spans_bounds)), key=lambda i: spans_bounds[i][0])
+    tokens_order = sorted(range(len(tokens_offsets)), key=lambda i: min(tokens_offsets[i]))
+    active, active_ends = set(), []
+    next_span = 0
+    for idt in tokens_order:
+        t_start, t_end = tokens_offsets[idt]
+        while next_span < len(spans_order) and spans_bounds[spans_order[next_span]][0] <= max(t_start, t_end):
+            ids = spans_order[next_span]
+            active.add(ids)
+            heapq.heappush(active_ends, (spans_bounds[ids][1], ids))
+            next_span += 1
+        while active_ends and active_ends[0][0] < min(t_start, t_end):
+            active.discard(heapq.heappop(active_ends)[1])
+
+        for ids in sorted(active):
+            s_start, s_end = spans_starts[ids], spans_ends[ids]
+            # Check if there's any overlap between token and span
+            if alignment_mode == AlignmentMode.expand:
+                # Token is at least partially covered by the span
+                # Either the token start or end is within the span, or the span is completely within the token
+                if (t_start <= s_start < t_end   # span starts within token
+                        or t_start < s_end <= t_end   # span ends within token
+                        or (s_start <= t_start and s_end >= t_end)):  # span completely covers token
+                    alignments[idt].append(ids)
+            elif alignment_mode == AlignmentMode.contract:
+                # Token is completely within the span
+                if t_start >= s_start and t_end <= s_end:
+                    alignments[idt].append(ids)
+    return alignments
+
+
+def align_spans(spans: List[Span], tokens: List[str], tokens_offsets: TokensOffsets = None,
                 join_by: str = None, alignment_mode: AlignmentMode = AlignmentMode.expand,
                 return_dict=False) -> Union[Dict, List[List[int]]]:
     """
     Align spans to a given list of tokens
     :param spans: the list of spans
-    :param tokens: the tokens
-    :param tokens_offsets: Tokens offset, spans of the tokens.
+    :param tokens: the tokens. Only their number is used if tokens_offsets is given, so it can be a spacy Document
+    :param tokens_offsets: Tokens offset, spans of the tokens, as a list or an array (see `spacy_token_offsets`).
     Either tokens_offsets of join_by must be provided to compute spans.
     :param join_by: string used to join tokens. Either tokens_offsets of join_by must be provided to compute spans.
     :param alignment_mode: "contract" (span of all tokens completely within the character span),
@@ -35,25 +108,13 @@ def align_spans(spans: List[Span], tokens: List[str], tokens_offsets: List[Tuple
     """
     assert join_by is not None or tokens_offsets is not None, \
         "Either tokens_offsets of join_by must be provided to compute spans."
+    if isinstance(tokens_offsets, np.ndarray):
+        tokens_offsets = tokens_offsets.tolist()
     if not tokens_offsets:
         tokens_map = list(accumulate(map(lambda t: len(t) + len(join_by), tokens)))
         tokens_offsets = list(zip([0] + tokens_map, map(lambda x: x - len(join_by), tokens_map)))
-    alignments = [[] for _ in range(len(tokens))]
-
-    for idt, (t_start, t_end) in enumerate(tokens_offsets):
-        for ids, s in enumerate(spans):
-            # Check if there's any overlap between token and span
-            if alignment_mode == AlignmentMode.expand:
-                # Token is at least partially covered by the span
-                # Either the token start or end is within the span, or the span is completely within the token
-                if (t_start <= s.start < t_end   # span starts within token
-                        or t_start < s.end <= t_end   # span ends within token
-                        or (s.start <= t_start and s.end >= t_end)):  # span completely covers token
-                    alignments[idt].append(ids)
-            elif alignment_mode == AlignmentMode.contract:
-                # Token is completely within the span
-                if t_start >= s.start and t_end <= s.end:
-                    alignments[idt].append(ids)
+    alignments = _align_bounds([s.start for s in spans], [s.end for s in spans], tokens_offsets, len(tokens),
+                               alignment_mode)
 
     if return_dict:
         return {
@@ -63,16 +124,48 @@ def align_spans(spans: List[Span], tokens: List[str], tokens_offsets: List[Tuple
     return alignments
 
 
+def _filter_alignments(alignments: List[List[int]], tokens_offsets: List[Tuple[int, int]],
+                       labels: List[Any], scores: List[Optional[float]]) -> Tuple[List[List[int]], List]:
+    """
+    Keep the best span of each token, merging consecutive tokens whose best span has the same label
+    :param alignments: Indexes of the matching spans of each token, see `align_spans`
+    :param tokens_offsets: Tokens offsets
+    :param labels: Label of each span
+    :param scores: Score of each span, None if the span has no score
+    :return: The filtered spans, as [start, end, index of the span giving its label, score and KB ID],
+    and for each token the index of its filtered span and whether it continues the span, or None
+    """
+    filtered_spans = []
+    tokens_spans = [None] * len(alignments)
+    previous = None
+    for idx, alignment in enumerate(alignments):
+        if not alignment:
+            previous = None
+            continue
+        try:
+            best_span = max(alignment, key=scores.__getitem__)
+        except TypeError:
+            best_span = alignment[0]
+        if previous is not None and labels[filtered_spans[previous][2]] == labels[best_span]:
+            filtered_spans[previous][1] = tokens_offsets[idx][1]
+            tokens_spans[idx] = (previous, True)
+        else:
+            previous = len(filtered_spans)
+            filtered_spans.append([tokens_offsets[idx][0], tokens_offsets[idx][1], best_span])
+            tokens_spans[idx] = (previous, False)
+    return filtered_spans, tokens_spans
+
+
 def filter_overlapping_spans(spans: List[Span], tokens: List[str],
-                             tokens_offsets: List[Tuple[int, int]] = None,
+                             tokens_offsets: TokensOffsets = None,
                              join_by: str = None,
                              alignment_mode: AlignmentMode = AlignmentMode.expand,
                              evaluation_mode: Optional[str] = 'span',
                              return_dict=False) -> Union[List[Span], Dict]:
     """
     :param spans: List of spans to align
-    :param tokens: List of tokens
-    :param tokens_offsets: Tokens offset, spans of the tokens
+    :param tokens: List of tokens. Only their number is used if tokens_offsets is given, so it can be a spacy Document
+    :param tokens_offsets: Tokens offset, spans of the tokens, as a list or an array (see `spacy_token_offsets`)
     :param join_by: string used to join tokens. Either tokens_offsets of join_by must be provided to compute spans.
     :param alignment_mode: "contract" (span of all tokens completely within the character span),
      "expand" (span of all tokens at least partially covered by the character span).
@@ -86,28 +179,19 @@ def filter_overlapping_spans(spans: List[Span], tokens: List[str],
                              alignment_mode=alignment_mode, return_dict=True)
     alignments = align_dict['alignments']
     tokens_offsets = align_dict['tokens_offsets']
-    filtered_spans = [None] * len(alignments)
-    bio_token = ['O'] * len(alignments)
-    for idx, alignment in enumerate(alignments):
-        t_spans = [spans[a] for a in alignment]
-        if not t_spans:
-            continue
-        try:
-            best_span = max(t_spans, key=attrgetter('score'))
-        except TypeError:
-            best_span = t_spans[0]
-        if idx > 0 and filtered_spans[idx - 1] is not None and filtered_spans[idx - 1].label == best_span.label:
-            filtered_spans[idx - 1].end = tokens_offsets[idx][1]
-            bio_token[idx] = f"I-{filtered_spans[idx - 1].label}" if evaluation_mode == 'span' \
-                else f"B-{filtered_spans[idx - 1].label}"
-            filtered_spans[idx], filtered_spans[idx - 1] = filtered_spans[idx - 1], None
-        else:
-            filtered_spans[idx] = Span(start=tokens_offsets[idx][0], end=tokens_offsets[idx][1],
-                                       label=best_span.label, kb_id=best_span.kb_id, score=best_span.score)
-            bio_token[idx] = f"B-{filtered_spans[idx].label}"
+    filtered, tokens_spans = _filter_alignments(alignments, tokens_offsets, [s.label for s in spans],
+                                                [s.score for s in spans])
+    filtered_spans = [Span(start=start, end=end, label=spans[best].label, kb_id=spans[best].kb_id,
+                           score=spans[best].score)
+                      for start, end, best in filtered]
 
-    filtered_spans = list(filter(None, filtered_spans))
     if return_dict:
+        bio_token = ['O'] * len(alignments)
+        for idx, token_span in enumerate(tokens_spans):
+            if token_span is not None:
+                filtered_idx, inside = token_span
+                label = filtered_spans[filtered_idx].label
+                bio_token[idx] = f"I-{label}" if inside and evaluation_mode == 'span' else f"B-{label}"
         return {
             'bio': bio_token,
             'filtered_spans': filtered_spans,
@@ -115,3 +199,37 @@ def filter_overlapping_spans(spans: List[Span], tokens: List[str],
             'tokens_offsets': tokens_offsets
         }
     return filtered_spans
+
+
+def filter_overlapping_span_batch(spans: SpanBatch, docs: List[Doc],
+                                  alignment_mode: AlignmentMode = AlignmentMode.expand) -> SpanBatch:
+    """
+    Filter the overlapping spans of a batch of documents, as `filter_overlapping_spans` does for each document,
+    without converting the SpanBatch to Spans
+    :param spans: Spans of the documents
+    :param docs: spacy Documents of the batch. Their tokens offsets are taken from `spacy_token_offsets`
+    :param alignment_mode: "contract" (span of all tokens completely within the character span),
+     "expand" (span of all tokens at least partially covered by the character span).
+    :return: the filtered spans of each document
+    """
+    starts, ends, labels = spans.start.tolist(), spans.end.tolist(), spans.label_id.tolist()
+    scores = [None if s != s else s for s in spans.score.tolist()]
+    doc_idx, start, end, selected = [], [], [], []
+    for idx, (doc, doc_spans) in enumerate(zip(docs, spans.doc_indices())):
+        doc_spans = doc_spans.tolist()
+        if not doc_spans:
+            continue
+        tokens_offsets = spacy_token_offsets(doc, as_list=True)
+        alignments = _align_bounds([starts[i] for i in doc_spans], [ends[i] for i in doc_spans], tokens_offsets,
+                                   len(doc), alignment_mode)
+        filtered, _ = _filter_alignments(alignments, tokens_offsets, [labels[i] for i in doc_spans],
+                                         [scores[i] for i in doc_spans])
+        for f_start, f_end, best in filtered:
+            doc_idx.append(idx)
+            start.append(f_start)
+            end.append(f_end)
+            selected.append(doc_spans[best])
+    selected = np.asarray(selected, dtype=np.int64)
+    kb_ids = [spans.kb_ids[i] for i in selected] if spans.kb_ids is not None else None
+    return SpanBatch(doc_idx, start, end, spans.label_id[selected], spans.score[selected], spans.labels,
+                     kb_ids=kb_ids, num_docs=spans.num_docs)
@@ -0,0 +1,54 @@
+from itertools import chain
+from typing import Any, List, Optional
+
+
+def token_budget_batches(lengths: List[int], max_tokens: int, batch_size: Optional[int] = None) -> List[List[int]]:
+    """
+    Sort the items by length and pack them into batches whose padded size (number of items x longest item)
+    doesn't exceed the token budget. Items longer than the budget are placed alone in their batch.
+    :param lengths: Length (number of tokens) of each item
+    :param max_tokens: Max number of tokens in a batch, including padding
+    :param batch_size: Max number of items in a batch. If None, only the token budget is used
+    :return: Batches of item indexes, sorted by length
+    """
+    batches = []
+    batch = []
+    for idx in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        # Items are sorted, so the new item is the longest of the batch
+        if batch and ((len(batch) + 1) * lengths[idx] > max_tokens or (batch_size and len(batch) >= batch_size)):
+            batches.append(batch)
+            batch = []
+        batch.append(idx)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def make_batches(lengths: List[int], batch_size: Optional[int] = None,
+                 max_tokens: Optional[int] = None) -> List[List[int]]:
+    """
+    Split the items in batches of item indexes. If a token budget is given, items are sorted by length
+    and packed with `token_budget_batches`. Otherwise, they are split in batches of `batch_size` items
+    in their original order
+    :param lengths: Length (number of tokens) of each item
+    :param batch_size: Max number of items in a batch. If None, all the items are in the same batch
+    :param max_tokens: Max number of tokens in a batch, including padding
+    :return: Batches of item indexes
+    """
+    if max_tokens:
+        return token_budget_batches(lengths, max_tokens, batch_size)
+    batch_size = batch_size or max(len(lengths), 1)
+    return [list(range(i, min(i + batch_size, len(lengths)))) for i in range(0, len(lengths), batch_size)]
+
+
+def restore_order(batches: List[List[int]], results: List[Any]) -> List[Any]:
+    """
+    Put the results of items processed in batches back in the original order of the items
+    :param batches: Batches of item indexes, as returned by `token_budget_batches`
+    :param results: Result of each item, in the order of the batches
+    :return: Results in the original order of the items
+    """
+    ordered_results = [None] * len(results)
+    for idx, result in zip(chain.from_iterable(batches), results):
+        ordered_results[idx] = result
+    return ordered_results
@@ -1,3 +1,4 @@
 from zshot.utils.data_models.entity import Entity  # noqa: F401
 from zshot.utils.data_models.relation import Relation  # noqa: F401
 from zshot.utils.data_models.span import Span  # noqa: F401
+from zshot.utils.data_models.span_batch import SpanBatch  # noqa: F401
@@ -1,13 +1,9 @@
-import zlib
-from typing import Optional, List
-from pydantic import BaseModel
+from typing import List, Optional
 
+from zshot.utils.data_models.hashable_model import HashableModel
 
-class Entity(BaseModel):
+
+class Entity(HashableModel):
     name: str
     description: Optional[str] = None
     vocabulary: Optional[List[str]] = None
-
-    def __hash__(self):
-        self_repr = f"{self.__class__.__name__}.{str(self.__dict__)}"
-        return zlib.crc32(self_repr.encode())
@@ -0,0 +1,31 @@
+import zlib
+from functools import lru_cache
+from typing import Any, Tuple
+
+from pydantic import BaseModel
+
+
+@lru_cache(maxsize=2 ** 16)
+def fields_hash(class_name: str, key: Tuple[Any, ...]) -> int:
+    """ crc32 of the fields of a model, so the hash is the same in every process (e.g. for task names)
+
+    :param class_name: Name of the class of the model
+    :param key: Values of the fields of the model
+    """
+    return zlib.crc32(f"{class_name}.{key!r}".encode())
+
+
+class HashableModel(BaseModel):
+    """ Pydantic model hashed and compared by the tuple of its fields.
+    Hashes are cached by fields, so hashing the same entities or relations again (e.g. every time
+    a knowledge graph is set) only builds the tuple of fields """
+
+    def fields_key(self) -> Tuple[Any, ...]:
+        """ Tuple of the values of all the fields, with lists converted to tuples """
+        return tuple([tuple(value) if isinstance(value, list) else value for value in self.__dict__.values()])
+
+    def __hash__(self):
+        return fields_hash(self.__class__.__name__, self.fields_key())
+
+    def __eq__(self, other: Any):
+        return type(other) is type(self) and self.fields_key() == other.fields_key()
@@ -1,13 +1,14 @@
-from typing import Optional
+from typing import List, Optional
 
-import zlib
-from pydantic import BaseModel
+from zshot.utils.data_models.hashable_model import HashableModel
 
 
-class Relation(BaseModel):
+class Relation(HashableModel):
     name: str
     description: Optional[str] = None
-
-    def __hash__(self):
-        self_repr = f"{self.__class__.__name__}.{str(self.__dict__)}"
-        return zlib.crc32(self_repr.encode())
+    # Labels of the entities allowed as subject/object of the relation. If None, any label is allowed
+    subject_labels: Optional[List[str]] = None
+    object_labels: Optional[List[str]] = None
+    # Max distance between the entities of the relation, in characters or in sentences. If None, it isn't limited
+    max_char_distance: Optional[int] = None
+    max_sentence_distance: Optional[int] = None
@@ -1,5 +1,3 @@
-import zlib
-
 from spacy.tokens import Span
 
 from zshot.utils.data_models import Relation
@@ -25,7 +23,8 @@ class RelationSpan:
         return f"{self.relation.name}, {self.start}, {self.end}, {self.score}"
 
     def __hash__(self):
-        return zlib.crc32(self.__repr__().encode())
+        # Same fields as __eq__
+        return hash((self.start, self.end, self.relation))
 
     def __eq__(self, other):
         return (type(other) is type(self)
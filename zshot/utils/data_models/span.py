@@ -1,13 +1,12 @@
 from typing import Any, Dict
 
-
-import zlib
-
 import spacy
 from spacy.tokens import Doc
 
 
 class Span:
+    __slots__ = ('start', 'end', 'label', 'score', 'kb_id')
+
     def __init__(self, start: int, end: int, label: str = None, score: float = None, kb_id: str = None):
         """  Class for handling Spans with scores
 
@@ -27,7 +26,8 @@ class Span:
         return f"{self.label}, {self.start}, {self.end}, {self.score}"
 
     def __hash__(self):
-        return zlib.crc32(self.__repr__().encode())
+        # Same fields as __eq__
+        return hash((self.start, self.end, self.label, self.score))
 
     def __eq__(self, other: Any):
         return (type(other) is type(self)
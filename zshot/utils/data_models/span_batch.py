@@ -0,0 +1,142 @@
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+import spacy
+from spacy.tokens import Doc
+
+from zshot.utils.data_models.span import Span
+
+
+class SpanBatch:
+    __slots__ = ('doc_idx', 'start', 'end', 'label_id', 'score', 'labels', 'kb_ids', 'num_docs')
+
+    def __init__(self, doc_idx: Sequence[int], start: Sequence[int], end: Sequence[int],
+                 label_id: Sequence[int], score: Sequence[float], labels: List[str],
+                 kb_ids: Optional[Sequence[str]] = None, num_docs: Optional[int] = None):
+        """ Columnar representation of the spans predicted for a batch of documents.
+        Each span is a row of the arrays, and labels are interned in a table shared by all the spans.
+
+        :param doc_idx: Index of the document of each span
+        :param start: Start char idx of each span
+        :param end: End char idx of each span
+        :param label_id: Index of the label of each span in the label table, -1 if the span has no label
+        :param score: Score of each span, NaN if the span has no score
+        :param labels: Label table
+        :param kb_ids: ID to Knowledge base of each span. If None, the spans have no KB ID
+        :param num_docs: Number of documents of the batch. If None, the last document with spans
+        """
+        self.doc_idx = np.asarray(doc_idx, dtype=np.int32)
+        self.start = np.asarray(start, dtype=np.int32)
+        self.end = np.asarray(end, dtype=np.int32)
+        self.label_id = np.asarray(label_id, dtype=np.int32)
+        self.score = np.asarray(score, dtype=np.float64)
+        self.labels = list(labels)
+        self.kb_ids = list(kb_ids) if kb_ids is not None else None
+        self.num_docs = num_docs if num_docs is not None else int(self.doc_idx.max(initial=-1)) + 1
+
+    def __len__(self) -> int:
+        return len(self.doc_idx)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({len(self)} spans, {self.num_docs} docs, {len(self.labels)} labels)"
+
+    def __eq__(self, other) -> bool:
+        return (type(other) is type(self)
+                and self.num_docs == other.num_docs
+                and self.to_spans() == other.to_spans())
+
+    @property
+    def label_array(self) -> np.ndarray:
+        """ Label of each span, None if the span has no label """
+        return np.asarray(self.labels + [None], dtype=object)[self.label_id]
+
+    def doc_indices(self) -> List[np.ndarray]:
+        """ Indexes of the spans of each document, keeping the order of the spans """
+        order = np.argsort(self.doc_idx, kind='stable')
+        bounds = np.searchsorted(self.doc_idx[order], np.arange(self.num_docs + 1))
+        return [order[doc_start:doc_end] for doc_start, doc_end in zip(bounds[:-1], bounds[1:])]
+
+    @staticmethod
+    def from_spans(spans: List[List[Span]]) -> "SpanBatch":
+        """ Create a SpanBatch from the spans of each document
+
+        :param spans: List of Spans for each document
+        """
+        labels_ids: Dict[str, int] = {}
+        doc_idx, start, end, label_id, score, kb_ids = [], [], [], [], [], []
+        for idx, doc_spans in enumerate(spans):
+            for s in doc_spans:
+                doc_idx.append(idx)
+                start.append(s.start)
+                end.append(s.end)
+                label_id.append(-1 if s.label is None else labels_ids.setdefault(s.label, len(labels_ids)))
+                score.append(np.nan if s.score is None else s.score)
+                kb_ids.append(s.kb_id)
+        if all(kb_id is None for kb_id in kb_ids):
+            kb_ids = None
+        return SpanBatch(doc_idx, start, end, label_id, score, list(labels_ids), kb_ids=kb_ids, num_docs=len(spans))
+
+    def to_spans(self) -> List[List[Span]]:
+        """ Convert the SpanBatch to a list of Spans for each document, keeping the order of the spans """
+        spans = [[] for _ in range(self.num_docs)]
+        labels = self.labels + [None]
+        kb_ids = self.kb_ids if self.kb_ids is not None else [None] * len(self)
+        scores = [None if s != s else s for s in self.score.tolist()]
+        for idx, start, end, label_id, score, kb_id in zip(self.doc_idx.tolist(), self.start.tolist(),
+                                                           self.end.tolist(), self.label_id.tolist(),
+                                                           scores, kb_ids):
+            spans[idx].append(Span(start, end, label=labels[label_id], score=score, kb_id=kb_id))
+        return spans
+
+    @staticmethod
+    def from_spacy_spans(spans: List[Iterable[spacy.tokens.Span]],
+                         scores: Optional[List[Sequence[float]]] = None) -> "SpanBatch":
+        """ Create a SpanBatch from the spacy spans of each document, e.g. their entities
+
+        :param spans: List of spacy Spans for each document
+        :param scores: Scores of the spans of each document. If None, the spans have no score
+        """
+        labels_ids: Dict[str, int] = {}
+        doc_idx, start, end, label_id, score, kb_ids = [], [], [], [], [], []
+        for idx, doc_spans in enumerate(spans):
+            doc_spans = list(doc_spans)
+            doc_scores = scores[idx] if scores is not None else [np.nan] * len(doc_spans)
+            for s, s_score in zip(doc_spans, doc_scores):
+                doc_idx.append(idx)
+                start.append(s.start_char)
+                end.append(s.end_char)
+                label_id.append(labels_ids.setdefault(s.label_, len(labels_ids)))
+                score.append(np.nan if s_score is None else s_score)
+                kb_ids.append(s.kb_id_ or None)
+        if all(kb_id is None for kb_id in kb_ids):
+            kb_ids = None
+        return SpanBatch(doc_idx, start, end, label_id, score, list(labels_ids), kb_ids=kb_ids, num_docs=len(spans))
+
+    def to_spacy_spans(self, docs: List[Doc]) -> List[List[spacy.tokens.Span]]:
+        """ Convert the SpanBatch to a list of spacy Spans for each document, as `Span.to_spacy_span` does
+
+        :param docs: spacy Documents of the batch
+        """
+        spacy_spans = [[] for _ in range(self.num_docs)]
+        labels = self.labels + [None]
+        kb_ids = self.kb_ids if self.kb_ids is not None else [None] * len(self)
+        for idx, start, end, label_id, kb_id in zip(self.doc_idx.tolist(), self.start.tolist(), self.end.tolist(),
+                                                    self.label_id.tolist(), kb_ids):
+            kwargs = {'alignment_mode': 'expand'}
+            if kb_id:
+                kwargs['kb_id'] = kb_id
+            if labels[label_id]:
+                kwargs['label'] = labels[label_id]
+            spacy_spans[idx].append(docs[idx].char_span(start, end, **kwargs))
+        return spacy_spans
+
+
+def as_spans(spans: Union[List[List[Span]], SpanBatch]) -> List[List[Span]]:
+    """ Get the list of Spans of each document of the predictions of a component,
+    which can be a list of Spans for each document or a SpanBatch
+
+    :param spans: Predictions of the component
+    """
+    if isinstance(spans, SpanBatch):
+        return spans.to_spans()
+    return spans
@@ -13,7 +13,7 @@ from zshot.utils.displacy.templates import TPL_REL_WORDS, TPL_SCRIPT, TPL_PAGE,
 
 
 def parse_rels(doc: Doc) -> Dict:
-    filtered_spans = filter_overlapping_spans(doc._.spans, list(doc), tokens_offsets=spacy_token_offsets(doc))
+    filtered_spans = filter_overlapping_spans(doc._.spans, doc, tokens_offsets=spacy_token_offsets(doc, as_list=True))
     filtered_spans.sort(key=lambda x: x.start)
     tokens_span = []
     if filtered_spans:
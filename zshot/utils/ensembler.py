@@ -92,15 +92,21 @@ class Ensembler:
 
     @staticmethod
     def inclusive(spans: List[Span]) -> List[Span]:
-        n = len(spans)
-        non_overlapping_spans = []
-        for i in range(n):
-            is_overlapping = False
-            for j in range(n):
-                if spans[i].start >= spans[j].start and spans[i].end <= spans[j].end:
-                    if spans[i].start > spans[j].start or spans[i].end < spans[j].end:
-                        is_overlapping = True
-                        break
-            if not is_overlapping:
-                non_overlapping_spans.append(spans[i])
-        return non_overlapping_spans
+        """ Remove the spans strictly included in another span, keeping the order of the spans.
+        The spans are swept by start (and longest first), so a span is included in a previous one
+        if one of the previous spans with different positions ends after it.
+
+        :param spans: Spans to filter
+        """
+        order = sorted(range(len(spans)), key=lambda i: (spans[i].start, -spans[i].end))
+        is_included = [False] * len(spans)
+        max_end = None
+        group_end = None
+        for pos, idx in enumerate(order):
+            span = spans[idx]
+            if pos > 0 and (span.start, span.end) != (spans[order[pos - 1]].start, spans[order[pos - 1]].end):
+                # Spans with the same positions don't include each other, so they share the previous max end
+                max_end = group_end
+            is_included[idx] = max_end is not None and max_end >= span.end
+            group_end = span.end if group_end is None else max(group_end, span.end)
+        return [span for span, included in zip(spans, is_included) if not included]
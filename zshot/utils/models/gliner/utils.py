@@ -0,0 +1,35 @@
+from typing import List
+
+from zshot.utils.data_models import SpanBatch
+
+
+def gliner_predict(model, sentences: List[str], labels: List[str], batches: List[List[int]],
+                   flat_ner: bool = True, threshold: float = 0.5, multi_label: bool = False) -> SpanBatch:
+    """
+    Predict the entities of the sentences with a GLiNER model, in batches
+    :param model: GLiNER model
+    :param sentences: Sentences to predict
+    :param labels: Entity labels
+    :param batches: Batches of sentence indexes (see `make_batches`)
+    :param flat_ner: If True, overlapping spans are not allowed
+    :param threshold: Min score of the predicted spans
+    :param multi_label: If True, a span can have more than one label
+    :return: SpanBatch with the spans of the sentences
+    """
+    # The predicted entities are collected in columns. Spans keep the index of their sentence,
+    # so they don't need to be put back in the order of the sentences
+    labels_ids = {label: idx for idx, label in enumerate(dict.fromkeys(labels))}
+    doc_idx, starts, ends, label_ids, scores = [], [], [], [], []
+    for batch in batches:
+        batch_entities = model.batch_predict_entities([sentences[i] for i in batch], labels,
+                                                      flat_ner=flat_ner, threshold=threshold,
+                                                      multi_label=multi_label)
+        for idx, entities in zip(batch, batch_entities):
+            for ent in entities:
+                doc_idx.append(idx)
+                starts.append(ent['start'])
+                ends.append(ent['end'])
+                label_ids.append(labels_ids.setdefault(ent['label'], len(labels_ids)))
+                scores.append(ent['score'])
+
+    return SpanBatch(doc_idx, starts, ends, label_ids, scores, list(labels_ids), num_docs=len(sentences))
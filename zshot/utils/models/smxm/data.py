@@ -1,5 +1,7 @@
-from typing import Any, Dict, List, Tuple, Union
+from itertools import chain
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import torch
 from torch.utils.data import Dataset
 from transformers import BertTokenizerFast
@@ -18,43 +20,71 @@ class ByDescriptionTaggerDataset(Dataset):
         return self.data[idx]
 
 
+class EncodedDescriptions:
+    def __init__(self, entity_descriptions: List[str], tokenizer: BertTokenizerFast):
+        """ Tokenized entity descriptions. They only depend on the entities, so they can be reused
+        to encode any sentence until the entities change
+
+        :param entity_descriptions: Descriptions of the entities, NEG first
+        :param tokenizer: Tokenizer used to encode the descriptions
+        """
+        self.tokenized_descriptions = [
+            tokenizer.tokenize(description) for description in entity_descriptions
+        ]
+        # Description part of each (sentence, description) sequence: description tokens + [SEP]
+        self.descriptions_ids = [
+            tokenizer.convert_tokens_to_ids(tokenized_description + ["[SEP]"])
+            for tokenized_description in self.tokenized_descriptions
+        ]
+        self.descriptions_segment_ids = [
+            [1] * (len(description_ids) + 1) for description_ids in self.descriptions_ids
+        ]
+        self.max_descriptions_tokens = max([len(d) for d in self.tokenized_descriptions])
+        self.max_sentence_tokens = 512 - self.max_descriptions_tokens - 3
+
+
 def encode_data(
     sentences: List[str],
     entity_labels: List[str],
     entity_descriptions: List[str],
     tokenizer: BertTokenizerFast,
+    encoded_descriptions: Optional[EncodedDescriptions] = None,
 ) -> Tuple[List[Dict[str, Any]], int]:
+    if encoded_descriptions is None:
+        encoded_descriptions = EncodedDescriptions(entity_descriptions, tokenizer)
+    max_sentence_tokens = encoded_descriptions.max_sentence_tokens
+    cls_id, sep_id = tokenizer.convert_tokens_to_ids(["[CLS]", "[SEP]"])
+
+    # Keep the encodings (offsets and word ids) of the sentences to decode the predictions
+    encodings = tokenizer(
+        sentences, add_special_tokens=False, truncation=True, max_length=max_sentence_tokens
+    ).encodings if sentences else []
+
     encoded_data = []
-    tokenized_descriptions = [
-        tokenizer.tokenize(description) for description in entity_descriptions
-    ]
-    max_descriptions_tokens = max([len(d) for d in tokenized_descriptions])
-    max_sentence_tokens = 512 - max_descriptions_tokens - 3
-
-    for sentence in sentences:
-        tokenized_sentence = tokenizer.tokenize(
-            sentence, truncation=True, max_length=max_sentence_tokens
-        )
+    for encoding in encodings:
+        tokenized_sentence = encoding.tokens
+        sentence_ids = [cls_id] + encoding.ids + [sep_id]
+        split_index = len(sentence_ids) - 1
+        sentence_segment_ids = [0] * split_index
+
         tokenized_texts_list = []
         input_ids_list = []
         input_masks_list = []
         segment_ids_list = []
 
-        for tokenized_description in tokenized_descriptions:
-            combined_tokenized_text = (
+        for tokenized_description, description_ids, description_segment_ids in zip(
+            encoded_descriptions.tokenized_descriptions,
+            encoded_descriptions.descriptions_ids,
+            encoded_descriptions.descriptions_segment_ids,
+        ):
+            input_ids = sentence_ids + description_ids
+
+            tokenized_texts_list.append(
                 ["[CLS]"] + tokenized_sentence + ["[SEP]"] + tokenized_description + ["[SEP]"]
             )
-            split_index = combined_tokenized_text.index("[SEP]")
-            input_ids = tokenizer.convert_tokens_to_ids(combined_tokenized_text)
-            input_mask = [1] * len(input_ids)
-            segment_ids = ([0] * split_index) + (
-                [1] * (len(combined_tokenized_text) - split_index)
-            )
-
-            tokenized_texts_list.append(combined_tokenized_text)
             input_ids_list.append(input_ids)
-            input_masks_list.append(input_mask)
-            segment_ids_list.append(segment_ids)
+            input_masks_list.append([1] * len(input_ids))
+            segment_ids_list.append(sentence_segment_ids + description_segment_ids)
 
         encoded_data.append(
             {
@@ -63,15 +93,24 @@ def encode_data(
                 "input_masks": input_masks_list,
                 "segment_ids": segment_ids_list,
                 "sep_index": split_index,
+                "encoding": encoding,
             }
         )
 
     return encoded_data, max_sentence_tokens
 
 
+def _pad_sequences(sequences: List[List[int]], padding_mask: np.ndarray) -> torch.Tensor:
+    """ Fill a zero padded int64 buffer with the sequences, in the order given by the padding mask """
+    buffer = np.zeros(padding_mask.shape, dtype=np.int64)
+    buffer[padding_mask] = np.fromiter(chain.from_iterable(sequences), dtype=np.int64,
+                                       count=int(padding_mask.sum()))
+    return torch.from_numpy(buffer)
+
+
 def tagger_multiclass_collator(
     data: Union[List[Dict[str, Any]], Dict[str, Any]],
-    device: torch.device,
+    device: Optional[torch.device] = None,
 ) -> Tuple[
     torch.Tensor,
     torch.Tensor,
@@ -80,67 +119,40 @@ def tagger_multiclass_collator(
     torch.Tensor,
     torch.Tensor,
 ]:
+    """ Collate encoded sentences into padded tensors of shape (num_descriptions, batch_size, seq_len)
+
+    :param data: Encoded sentences
+    :param device: Device to move the tensors to. If None, tensors are kept in CPU
+    (e.g.: when collating in DataLoader worker processes)
+    :return: Token ids, attention masks, segment ids, sep indexes, sequence mask and split tensors
+    """
     if isinstance(data, dict):
         data = [data]
 
-    input_ids_lists = [f["input_ids"] for f in data]
-    input_masks_lists = [f["input_masks"] for f in data]
-    segment_ids_lists = [f["segment_ids"] for f in data]
     batch_size = len(data)
-
-    sep_index = [f["sep_index"] for f in data]
-    max_sep_index = max(sep_index)
-
-    padded_bert_tokens_list = []
-    padded_bert_masks_list = []
-    padded_bert_segments_list = []
-
-    padded_sequence_mask = []
-
-    sentence_lengths = [
-        max([len(bert_tokens) for bert_tokens in input_ids_lists[i]])
-        for i in range(len(input_ids_lists))
-    ]
-    longest_sent = max(sentence_lengths)
-
-    for i in range(batch_size):
-        padded_bert_tokens = []
-        padded_bert_masks = []
-        padded_bert_segments = []
-
-        for j in range(len(input_ids_lists[i])):
-            padding = [0] * (longest_sent - len(input_ids_lists[i][j]))
-            padded_bert_tokens.append(input_ids_lists[i][j] + padding)
-            padded_bert_masks.append(input_masks_lists[i][j] + padding)
-            padded_bert_segments.append(segment_ids_lists[i][j] + padding)
-
-        bert_tokens_t = torch.tensor(padded_bert_tokens).to(device)
-        bert_masks_t = torch.tensor(padded_bert_masks).to(device)
-        bert_segments_t = torch.tensor(padded_bert_segments).to(device)
-
-        padded_bert_tokens_list.append(bert_tokens_t)
-        padded_bert_masks_list.append(bert_masks_t)
-        padded_bert_segments_list.append(bert_segments_t)
-
-        padded_sequence_mask.append(
-            sep_index[i] * [1] + (max_sep_index - sep_index[i]) * [0]
-        )
-
-    bert_tokens_t = torch.stack(padded_bert_tokens_list).transpose(1, 0)
-    bert_masks_t = torch.stack(padded_bert_masks_list).transpose(1, 0)
-    bert_segments_t = torch.stack(padded_bert_segments_list).transpose(1, 0)
-    bert_seq_mask_t = torch.tensor(padded_sequence_mask).to(
-        device=device, dtype=torch.uint8
+    num_descriptions = len(data[0]["input_ids"])
+
+    # Sequences are ordered by description and then by sentence, as in the output tensors
+    input_ids_lists = [f["input_ids"][j] for j in range(num_descriptions) for f in data]
+    input_masks_lists = [f["input_masks"][j] for j in range(num_descriptions) for f in data]
+    segment_ids_lists = [f["segment_ids"][j] for j in range(num_descriptions) for f in data]
+
+    lengths = np.array([len(input_ids) for input_ids in input_ids_lists]).reshape(num_descriptions, batch_size)
+    longest_sent = lengths.max()
+    padding_mask = np.arange(longest_sent) < lengths[..., None]
+
+    sep_index = np.array([f["sep_index"] for f in data], dtype=np.int64)
+    padded_sequence_mask = (np.arange(sep_index.max()) < sep_index[:, None]).astype(np.uint8)
+
+    tensors = (
+        _pad_sequences(input_ids_lists, padding_mask),
+        _pad_sequences(input_masks_lists, padding_mask),
+        _pad_sequences(segment_ids_lists, padding_mask),
+        torch.from_numpy(sep_index),
+        torch.from_numpy(padded_sequence_mask),
+        torch.tensor(2),
     )
-    bert_sep_t = torch.tensor(sep_index).to(device=device)
-
-    split = torch.tensor(2).to(device=device)
+    if device is not None:
+        tensors = tuple(t.to(device) for t in tensors)
 
-    return (
-        bert_tokens_t,
-        bert_masks_t,
-        bert_segments_t,
-        bert_sep_t,
-        bert_seq_mask_t,
-        split,
-    )
+    return tensors
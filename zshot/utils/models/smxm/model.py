@@ -1,5 +1,3 @@
-import random
-
 import torch
 from transformers import BertModel, BertPreTrainedModel, logging
 
@@ -29,73 +27,95 @@ class BertTaggerMultiClass(BertPreTrainedModel):
         sep_index,
         seq_mask,
         split,
+        chunk_size=None,
         **kwargs,
     ):
-        sep_index_max = torch.max(sep_index)
-        predictions = []
-        predictions_zero = []
-        predictions_zero_base = []
-        for j in range(input_ids.size(0)):
-            if j == 0:
-                inp_zero = torch.stack(
-                    [
-                        input_ids[j][i, : sep_index_max.item()]
-                        for i in range(sep_index.size(0))
-                    ]
-                )
-                att_zero = torch.stack(
-                    [
-                        attention_mask[j][i, : sep_index_max.item()]
-                        for i in range(sep_index.size(0))
-                    ]
-                )
-                tok_type_zero = torch.stack(
-                    [
-                        token_type_ids[j][i, : sep_index_max.item()]
-                        for i in range(sep_index.size(0))
-                    ]
-                )
-                with torch.no_grad():
-                    words_out = self.bert(
-                        input_ids=inp_zero,
-                        attention_mask=att_zero,
-                        token_type_ids=tok_type_zero,
-                    )[0]
-
-                pooled_out = self.drop(words_out)
-                logits = self.linear_zero3(pooled_out)
-                predictions_zero_base.append(logits)
-            else:
-                with torch.no_grad():
-                    words_out = self.bert(
-                        input_ids=input_ids[j],
-                        attention_mask=attention_mask[j],
-                        token_type_ids=token_type_ids[j],
-                    )[0]
+        """
+        Compute the logits of every (sentence, description) pair of the batch.
+        The pairs of all the descriptions are flattened and encoded in chunks of `chunk_size` pairs.
+        :param input_ids: Token ids with shape (num_descriptions, batch_size, seq_len). First description is NEG
+        :param attention_mask: Attention mask with the same shape as input_ids
+        :param token_type_ids: Token type ids with the same shape as input_ids
+        :param sep_index: Index of the first [SEP] token (sentence length) for each sentence in the batch
+        :param chunk_size: Max number of pairs encoded in one BERT forward, to cap memory usage.
+        If None, `batch_size` pairs are encoded at once
+        :return: Logits with shape (batch_size, max_sentence_len, num_descriptions)
+        """
+        neg_logits, zero_logits, logits = self.description_logits(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=token_type_ids,
+            sep_index=sep_index,
+            chunk_size=chunk_size,
+        )
+        return self.assemble_logits(neg_logits, zero_logits, logits)
 
-                words_out = torch.stack(
-                    [
-                        words_out[i, : sep_index_max.item(), :]
-                        for i in range(words_out.size(0))
-                    ]
-                )
-                pooled_out = self.drop(words_out)
-                predictions_zero.append(self.linear_zero2(pooled_out))
-                logits = self.linear(pooled_out)
-                predictions.append(logits)
+    def description_logits(self, input_ids, attention_mask, token_type_ids, sep_index, chunk_size=None, **kwargs):
+        """
+        Compute the logits of each (sentence, description) pair separately. Only the final softmax mixes
+        the descriptions, so the logits of any subset of the descriptions can be assembled from them
+        with `assemble_logits`. Takes the same inputs as `forward`
+        :return: Tuple with the NEG logits, with shape (batch_size, max_sentence_len), and the "no entity" and
+        entity logits of each description, with shape (batch_size, max_sentence_len, num_descriptions - 1)
+        """
+        num_descriptions, batch_size, seq_len = input_ids.size()
+        sep_index_max = torch.max(sep_index).item()
+        chunk_size = chunk_size or batch_size
 
-        random.shuffle(predictions_zero)
-        predictions_zero = torch.stack(predictions_zero_base + predictions_zero)
-        predictions_zero = predictions_zero.transpose(0, 1).transpose(1, 2)
-        predictions_zero = predictions_zero.contiguous().view(
-            predictions_zero.size(0), predictions_zero.size(1), -1
+        # NEG description is encoded only with the sentence tokens
+        neg_out = self._encode(
+            input_ids[0, :, :sep_index_max],
+            attention_mask[0, :, :sep_index_max],
+            token_type_ids[0, :, :sep_index_max],
+            sep_index_max,
+            chunk_size,
         )
+        neg_logits = self.linear_zero3(self.drop(neg_out)).squeeze(2)
 
-        predictions_zero = torch.max(predictions_zero, dim=2)[0].unsqueeze(2)
+        words_out = self._encode(
+            input_ids[1:].reshape(-1, seq_len),
+            attention_mask[1:].reshape(-1, seq_len),
+            token_type_ids[1:].reshape(-1, seq_len),
+            sep_index_max,
+            chunk_size,
+        )
+        pooled_out = self.drop(words_out.view(num_descriptions - 1, batch_size, sep_index_max, -1))
+        zero_logits = self.linear_zero2(pooled_out).squeeze(3).permute(1, 2, 0)
+        logits = self.linear(pooled_out).squeeze(3).permute(1, 2, 0)
 
-        predictions = torch.stack(predictions)
-        predictions = predictions.transpose(0, 1).transpose(1, 2).squeeze(3)
+        return neg_logits, zero_logits, logits
 
-        logits = torch.cat((predictions_zero, predictions), dim=2)
+    @staticmethod
+    def assemble_logits(neg_logits, zero_logits, logits, columns=None):
+        """
+        Assemble the logits of a set of descriptions from the output of `description_logits`
+        :param neg_logits: NEG logits
+        :param zero_logits: "No entity" logits of each description
+        :param logits: Entity logits of each description
+        :param columns: Indexes of the descriptions (without NEG) to use. If None, all the descriptions are used
+        :return: Logits with shape (batch_size, max_sentence_len, len(columns) + 1)
+        """
+        if columns is not None:
+            zero_logits = zero_logits[:, :, columns]
+            logits = logits[:, :, columns]
+        zero_logits = torch.cat((neg_logits.unsqueeze(2), zero_logits), dim=2)
+        zero_logits = torch.max(zero_logits, dim=2, keepdim=True)[0]
+        return torch.cat((zero_logits, logits), dim=2)
 
-        return logits
+    def _encode(self, input_ids, attention_mask, token_type_ids, max_len, chunk_size=None):
+        """
+        Encode the sequences with BERT, in chunks of `chunk_size` sequences
+        :return: Last hidden states truncated to `max_len` tokens
+        """
+        chunk_size = chunk_size or input_ids.size(0)
+        words_out = []
+        with torch.no_grad():
+            for i in range(0, input_ids.size(0), chunk_size):
+                words_out.append(
+                    self.bert(
+                        input_ids=input_ids[i:i + chunk_size],
+                        attention_mask=attention_mask[i:i + chunk_size],
+                        token_type_ids=token_type_ids[i:i + chunk_size],
+                    )[0][:, :max_len, :]
+                )
+        return torch.cat(words_out)
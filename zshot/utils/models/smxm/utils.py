@@ -1,13 +1,15 @@
 from functools import partial
 from typing import List, Tuple
 
+import numpy as np
 import torch
+from tokenizers import Encoding
 from torch.utils.data import DataLoader
-from transformers import BertTokenizerFast
 
+from zshot.utils.batching import restore_order, token_budget_batches
 from zshot.utils.models.smxm.data import encode_data, ByDescriptionTaggerDataset, tagger_multiclass_collator
 from zshot.utils.data_models import Entity
-from zshot.utils.data_models import Span
+from zshot.utils.data_models import SpanBatch
 
 
 class SmxmInput(dict):
@@ -33,101 +35,84 @@ class SmxmInput(dict):
 
 
 def predictions_to_span_annotations(
-        sentences: List[str],
-        predictions: List[List[int]],
-        probabilities: List[List[List[float]]],
+        encodings: List[Encoding],
+        predictions: List[np.ndarray],
+        probabilities: List[np.ndarray],
         entities: List[str],
-        tokenizer: BertTokenizerFast,
-        max_sentence_tokens: int,
-) -> List[List[Span]]:
-    span_annotations = []
-    for i, sentence_full in enumerate(sentences):
-        sentence = sentence_full.split(" ")
-        sentence_span_annotations = []
-
-        tokenization = tokenizer.encode_plus(
-            sentence,
-            return_token_type_ids=False,
-            return_attention_mask=False,
-            return_offsets_mapping=True,
-            is_split_into_words=True
-        )
-
-        num_tokens_full_sentence = len(tokenization["input_ids"]) - 2  # Exclude [CLS] and [SEP]
-        token_overflow = num_tokens_full_sentence - max_sentence_tokens
-        truncation_offset = token_overflow * (token_overflow > 0)
-
-        # Get mapping from tokens to words
-        mapping_input_id_to_word = tokenization.encodings[0].word_ids
-
-        # Create offset mappings for the words in the original sentence
-        words_offset_mappings = {}
-        word_index_offset = 0
-        for word_index, word in enumerate(sentence):
-            start_offset = sentence_full.find(word, word_index_offset)
-            end_offset = start_offset + len(word)
-            words_offset_mappings[word_index] = (start_offset, end_offset)
-            word_index_offset = end_offset + 1
-
-        # Track entity spans using B-I-O logic similar to the original function
+) -> SpanBatch:
+    """ Convert the token predictions into spans.
+    The label of each word is the label of its first token, and consecutive words with the same label
+    are merged into one span. Char offsets are taken from the encodings of the sentences.
+    The spans are collected in columns, without creating a Span for each of them.
+
+    :param encodings: Encodings of the (truncated) sentences, without special tokens
+    :param predictions: Predicted entity index for each position of each sentence. Position 0 is [CLS]
+    :param probabilities: Probability of the predicted entity for each position of each sentence
+    :param entities: Entity labels
+    :return: Spans of the sentences
+    """
+    # Entities with the same label share the same label id, so their spans are merged
+    labels_ids = {}
+    entities_ids = [labels_ids.setdefault(label, len(labels_ids)) for label in entities]
+    neg_id = labels_ids.get("NEG")
+    doc_idx, starts, ends, label_ids, scores = [], [], [], [], []
+
+    def add_span(sentence_idx, start, end, label_id, score):
+        doc_idx.append(sentence_idx)
+        starts.append(start)
+        ends.append(end)
+        label_ids.append(label_id)
+        scores.append(score)
+
+    for i, encoding in enumerate(encodings):
         current_entity = None
         current_start = None
+        current_end = None
         current_score = 0.0
 
-        for j, input_id in enumerate(mapping_input_id_to_word[truncation_offset:-1]):
-            if input_id is None:  # Skip special tokens
+        previous_word_id = None
+        for token_index, word_id in enumerate(encoding.word_ids):
+            if word_id is None:  # Skip special tokens
                 continue
+            start_offset, end_offset = encoding.offsets[token_index]
 
-            if input_id >= len(sentence):  # Handle potential out-of-bounds
+            # Only the first token of each word is used to predict the label of the word
+            if word_id == previous_word_id:
+                if current_entity is not None:
+                    current_end = end_offset
                 continue
-
-            pred = predictions[i][j]
-            entity_label = entities[pred]
-
-            # Only process first subtoken of each word (like original function's removal of "#" tokens)
-            is_first_subtoken = (j == 0) or (input_id != mapping_input_id_to_word[j - 1])
-
-            if is_first_subtoken:
-                if entity_label != "NEG":
-                    # Start new entity or continue current one
-                    if current_entity is None:
-                        # Start a new entity
-                        current_entity = entity_label
-                        current_start = words_offset_mappings[input_id][0]
-                        current_score = probabilities[i][j][pred]
-                    elif current_entity != entity_label:
-                        # Different entity - close the current one and start a new one
-                        sentence_span_annotations.append(
-                            Span(current_start, words_offset_mappings[input_id - 1][1],
-                                 current_entity, current_score)
-                        )
-                        current_entity = entity_label
-                        current_start = words_offset_mappings[input_id][0]
-                        current_score = probabilities[i][j][pred]
-                    else:
-                        # Same entity continues - update score if higher
-                        current_score = max(current_score, probabilities[i][j][pred])
+            previous_word_id = word_id
+
+            j = token_index + 1  # Skip [CLS]
+            entity_label = entities_ids[predictions[i][j]]
+            score = float(probabilities[i][j])
+
+            if entity_label != neg_id:
+                if current_entity is None:
+                    # Start a new entity
+                    current_entity = entity_label
+                    current_start = start_offset
+                    current_score = score
+                elif current_entity != entity_label:
+                    # Different entity - close the current one and start a new one
+                    add_span(i, current_start, current_end, current_entity, current_score)
+                    current_entity = entity_label
+                    current_start = start_offset
+                    current_score = score
                 else:
-                    # End any current entity
-                    if current_entity is not None:
-                        sentence_span_annotations.append(
-                            Span(current_start, words_offset_mappings[input_id - 1][1],
-                                 current_entity, current_score)
-                        )
-                        current_entity = None
+                    # Same entity continues - update score if higher
+                    current_score = max(current_score, score)
+                current_end = end_offset
+            elif current_entity is not None:
+                # End any current entity
+                add_span(i, current_start, current_end, current_entity, current_score)
+                current_entity = None
 
         # Handle any final entity
-        if current_entity is not None and len(mapping_input_id_to_word) > 1:
-            last_valid_id = mapping_input_id_to_word[-2]  # Last non-special token
-            if last_valid_id is not None and last_valid_id < len(sentence):
-                sentence_span_annotations.append(
-                    Span(current_start, words_offset_mappings[last_valid_id][1],
-                         current_entity, current_score)
-                )
+        if current_entity is not None:
+            add_span(i, current_start, current_end, current_entity, current_score)
 
-        span_annotations.append(sentence_span_annotations)
-
-    return span_annotations
+    return SpanBatch(doc_idx, starts, ends, label_ids, scores, list(labels_ids), num_docs=len(encodings))
 
 
 def get_entities_names_descriptions(
@@ -155,30 +140,85 @@ def get_entities_names_descriptions(
     return entity_labels, entity_descriptions
 
 
-def smxm_predict(model, tokenizer, sentences, entity_labels, entity_descriptions, batch_size):
-    encoded_data, max_sentence_tokens = encode_data(
-        sentences, entity_labels, entity_descriptions, tokenizer
+def smxm_predict(model, tokenizer, sentences, entity_labels, entity_descriptions, batch_size, chunk_size=None,
+                 encoded_descriptions=None, num_workers=0, max_tokens=None):
+    return smxm_predict_variants(model, tokenizer, sentences, [(entity_labels, entity_descriptions)], batch_size,
+                                 chunk_size=chunk_size, encoded_descriptions=encoded_descriptions,
+                                 num_workers=num_workers, max_tokens=max_tokens)[0]
+
+
+def union_descriptions(variants):
+    """
+    Union of the entities of several variants: the entities of the first variant, followed by the entities
+    of the other variants with new descriptions. NEG is the first entity of every variant
+    :param variants: List of (entity labels, entity descriptions) of each variant, with NEG as first entity
+    :return: Labels and descriptions of the union, and the indexes of the descriptions (without NEG)
+    of each variant in the union
+    """
+    all_labels, all_descriptions = list(variants[0][0]), list(variants[0][1])
+    description_index = {}
+    for i, description in enumerate(all_descriptions[1:]):
+        description_index.setdefault(description, i)
+    for entity_labels, entity_descriptions in variants[1:]:
+        for label, description in zip(entity_labels[1:], entity_descriptions[1:]):
+            if description not in description_index:
+                description_index[description] = len(all_descriptions) - 1
+                all_labels.append(label)
+                all_descriptions.append(description)
+    variants_columns = [[description_index[d] for d in entity_descriptions[1:]] for _, entity_descriptions in variants]
+    return all_labels, all_descriptions, variants_columns
+
+
+def smxm_predict_variants(model, tokenizer, sentences, variants, batch_size, chunk_size=None,
+                          encoded_descriptions=None, num_workers=0, max_tokens=None):
+    """
+    Predict the entities of the sentences for several variants of the entities (e.g. with different descriptions).
+    Each unique (sentence, description) pair is encoded once, and the logits of each variant are assembled
+    from the logits of its descriptions
+    :param model: SMXM model
+    :param tokenizer: Tokenizer of the model
+    :param sentences: Sentences to predict
+    :param variants: List of (entity labels, entity descriptions) of each variant, with NEG as first entity
+    :param batch_size: Number of sentences in each batch
+    :param chunk_size: Max number of pairs encoded in one BERT forward. If None, the number of sentences of the batch
+    :param encoded_descriptions: Tokenized descriptions of the union of the variants (see `union_descriptions`)
+    :param num_workers: Number of workers of the data loader
+    :param max_tokens: Max number of tokens in a batch. If given, sentences are batched by length
+    :return: SpanBatch with the span annotations of each variant
+    """
+    all_labels, all_descriptions, variants_columns = union_descriptions(variants)
+    encoded_data, _ = encode_data(
+        sentences, all_labels, all_descriptions, tokenizer, encoded_descriptions
     )
     dataset = ByDescriptionTaggerDataset(encoded_data)
-    dataloader = DataLoader(
-        dataset, batch_size=batch_size, collate_fn=partial(tagger_multiclass_collator, device=model.device)
-    )
+    # Batches collated in worker processes stay in CPU and are moved to the device in SmxmInput
+    collate_fn = partial(tagger_multiclass_collator, device=None if num_workers > 0 else model.device)
+    if max_tokens:
+        # Each sentence is padded to its longest (sentence, description) pair, for every description
+        lengths = [len(d["input_ids"]) * max(len(input_ids) for input_ids in d["input_ids"]) for d in encoded_data]
+        batches = token_budget_batches(lengths, max_tokens, batch_size)
+        dataloader = DataLoader(dataset, batch_sampler=batches, num_workers=num_workers, collate_fn=collate_fn)
+    else:
+        batches = None
+        dataloader = DataLoader(dataset, batch_size=batch_size, num_workers=num_workers, collate_fn=collate_fn)
 
-    preds = []
-    probabilities = []
+    preds = [[] for _ in variants]
+    probabilities = [[] for _ in variants]
     for batch in dataloader:
         with torch.no_grad():
             inputs = SmxmInput(*batch, device=model.device)
-            outputs = model(**inputs)
-            probability = (
-                torch.nn.Softmax(dim=-1)(outputs).cpu().numpy().tolist()
-            )
-            probabilities += [p for p in probability]
-            outputs = torch.argmax(outputs, dim=2)
-            preds += outputs.detach().cpu().numpy().tolist()
-
-    span_annotations = predictions_to_span_annotations(
-        sentences, preds, probabilities, entity_labels, tokenizer, max_sentence_tokens
-    )
-
-    return span_annotations
+            logits = model.description_logits(**inputs, chunk_size=chunk_size)
+            for variant_idx, columns in enumerate(variants_columns):
+                outputs = model.assemble_logits(*logits, columns=columns if len(variants) > 1 else None)
+                # Only the predicted entity and its probability are moved to the host
+                probability, prediction = torch.max(torch.softmax(outputs, dim=-1), dim=-1)
+                probabilities[variant_idx] += list(probability.cpu().numpy())
+                preds[variant_idx] += list(prediction.cpu().numpy())
+
+    if batches is not None:
+        preds = [restore_order(batches, variant_preds) for variant_preds in preds]
+        probabilities = [restore_order(batches, variant_probabilities) for variant_probabilities in probabilities]
+
+    encodings = [d["encoding"] for d in encoded_data]
+    return [predictions_to_span_annotations(encodings, variant_preds, variant_probabilities, entity_labels)
+            for (entity_labels, _), variant_preds, variant_probabilities in zip(variants, preds, probabilities)]
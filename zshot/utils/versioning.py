@@ -0,0 +1,41 @@
+from typing import Any, Collection, Optional
+
+
+class KGVersion:
+    """
+    Version stamp of a set of entities or relations. It keeps the items, so two versions are only equal if
+    their items are equal, and it doesn't rely on the hashes of the items. Items that are the same objects
+    are compared by identity, so comparing the versions of an unchanged set doesn't hash or compare its items
+    """
+    __slots__ = ('items', '_hash')
+
+    def __init__(self, items: Collection[Any]):
+        """
+        :param items: Collection of entities, relations or names
+        """
+        self.items = tuple(items)
+        self._hash = None
+
+    def __eq__(self, other) -> bool:
+        return type(other) is type(self) and (self.items is other.items or self.items == other.items)
+
+    def __hash__(self) -> int:
+        if self._hash is None:
+            self._hash = hash(self.items)
+        return self._hash
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({hash(self)})"
+
+
+def kg_version(items: Optional[Collection[Any]]) -> Optional[KGVersion]:
+    """
+    Compute a content fingerprint (version stamp) of a set of entities or relations.
+    The version only depends on the items and their order, so components can compare versions
+    to know if the derived state (tries, tokenized descriptions, tasks...) has to be rebuilt.
+    :param items: Collection of entities, relations or names
+    :return: The version stamp of the collection or None if no collection is given
+    """
+    if items is None:
+        return None
+    return KGVersion(items)
@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+from itertools import islice
 from typing import Optional, List, Union, Iterator
 
 from spacy.language import Language
@@ -24,7 +25,8 @@ from zshot.utils.data_models import Entity, Relation
     "relations_extractor": None,
     "knowledge_extractor": None,
     "disable_default_ner": True,
-    "device": None
+    "device": None,
+    "batch_max_tokens": None
 })
 def create_zshot_component(nlp: Language, name: str,
                            mentions: Optional[Union[List[Entity], str]],
@@ -35,10 +37,11 @@ def create_zshot_component(nlp: Language, name: str,
                            relations_extractor: Optional[Union[RelationsExtractor, str]],
                            knowledge_extractor: Optional[Union[KnowledgeExtractor, str]],
                            disable_default_ner: Optional[bool] = True,
-                           device: Optional[str] = None):
+                           device: Optional[str] = None,
+                           batch_max_tokens: Optional[int] = None):
     return Zshot(nlp, mentions, entities, relations,
                  mentions_extractor, linker, relations_extractor, knowledge_extractor,
-                 disable_default_ner, device)
+                 disable_default_ner, device, batch_max_tokens)
 
 
 class Zshot:
@@ -52,7 +55,8 @@ class Zshot:
                  relations_extractor,
                  knowledge_extractor,
                  disable_default_ner,
-                 device):
+                 device,
+                 batch_max_tokens=None):
         self.nlp = nlp
         self.mentions = mentions
         self.entities = entities
@@ -63,6 +67,7 @@ class Zshot:
         self.knowledge_extractor = knowledge_extractor
         self.disable_default_ner = disable_default_ner
         self.device = device
+        self.batch_max_tokens = batch_max_tokens
         self.setup()
 
     def setup(self):
@@ -103,6 +108,9 @@ class Zshot:
                                                           func_name=self.knowledge_extractor)()
             self.knowledge_extractor.set_device(device=self.device)
 
+        if self.batch_max_tokens is not None:
+            self.set_batch_max_tokens(self.batch_max_tokens)
+
         if self.mentions_extractor and self.mentions_extractor.require_existing_ner \
                 and "ner" not in self.nlp.pipe_names:
             raise ValueError(f"The pipeline you are using does not contains a NER,"
@@ -128,6 +136,9 @@ class Zshot:
         if not Doc.has_extension("relations"):
             Doc.set_extension("relations", default=[])
 
+        if not Doc.has_extension("token_offsets"):
+            Doc.set_extension("token_offsets", default=None)
+
     def __call__(self, doc: Doc) -> Doc:
         # Add the matched spans when doc is processed
         self.extracts_mentions([doc])
@@ -136,18 +147,47 @@ class Zshot:
         self.extract_knowledge([doc])
         return doc
 
-    def pipe(self, docs: Iterator[Doc], batch_size: int, **kwargs):
-        """.
+    def set_batch_max_tokens(self, batch_max_tokens: Optional[int]):
+        """ Set the max number of tokens in a batch for every component of the pipeline.
+        When set, components sort their inputs by length and pack them into batches up to this budget.
+
+        :param batch_max_tokens: Max number of tokens (including padding) in a batch,
+        or None to batch by number of documents
+        """
+        self.batch_max_tokens = batch_max_tokens
+        for component in (self.mentions_extractor, self.linker, self.relations_extractor, self.knowledge_extractor):
+            if component:
+                component.set_batch_max_tokens(batch_max_tokens)
+
+    def pipe(self, docs: Iterator[Doc], batch_size: int, batch_max_tokens: Optional[int] = None, **kwargs):
+        """ Process a stream of documents in chunks of `batch_size`.
+        Each chunk goes through every stage of the pipeline and is yielded before the next chunk is read,
+        so memory usage depends on the batch size and not on the number of documents.
+
         docs: A sequence of spacy documents.
+        batch_size: Number of documents processed together. If None, all documents are processed at once.
+        batch_max_tokens: Max number of tokens in the batches of each component. If given, it replaces
+        the one in the pipeline configuration for this call only. It can be set with
+        `nlp.pipe(texts, component_cfg={"zshot": {"batch_max_tokens": 4096}})`.
         YIELDS (Doc): A sequence of Doc objects, in order.
         """
-        docs = list(docs)
-        self.extracts_mentions(docs, batch_size=batch_size)
-        self.link_entities(docs, batch_size=batch_size)
-        self.extract_relations(docs, batch_size=batch_size)
-        self.extract_knowledge(docs, batch_size=batch_size)
-        for doc in docs:
-            yield doc
+        previous_batch_max_tokens = self.batch_max_tokens
+        if batch_max_tokens is not None:
+            self.set_batch_max_tokens(batch_max_tokens)
+        try:
+            docs = iter(docs)
+            while True:
+                batch = list(islice(docs, batch_size))
+                if not batch:
+                    break
+                self.extracts_mentions(batch, batch_size=batch_size)
+                self.link_entities(batch, batch_size=batch_size)
+                self.extract_relations(batch, batch_size=batch_size)
+                self.extract_knowledge(batch, batch_size=batch_size)
+                yield from batch
+        finally:
+            if batch_max_tokens is not None:
+                self.set_batch_max_tokens(previous_batch_max_tokens)
 
     def extracts_mentions(self, docs: Iterator[Doc], batch_size=None):
         if self.mentions_extractor and not (self.linker is not None and self.linker.is_end2end):